@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Compare the pure-Python field of view engine (tcod/fov.py) with libtcod's.
+
+    fov_benchmark.py [--maps N] [--origins N] [--radius R] [--seed S]
+
+Generates N dungeon levels and computes the field of view from distinct
+random floor cells on each, with every engine available, reporting the time
+per computation and how often the engines agree cell for cell. When libtcod
+cannot be loaded, only the Python engine is timed. A given seed always
+benchmarks the same levels and viewpoints.
+"""
+import os
+import random
+import sys
+import time
+from optparse import OptionParser
+
+try:
+    import tcod
+except OSError:
+    print 'libtcod could not be loaded; timing the Python engine only.'
+    os.environ['TCOD_HEADLESS'] = '1'
+    import tcod
+from tcod import libtcod
+
+from game import const, dungeon, rng
+
+ALGORITHMS = [('basic', libtcod.FOV_BASIC), ('shadow', libtcod.FOV_SHADOW)]
+
+def make_levels(count, seed):
+    streams = rng.Streams(seed)
+    levels = []
+    for level in range(1, count + 1):
+        map = dungeon.Map(tcod.Console(const.VIEW_WIDTH, const.VIEW_HEIGHT), level=level)
+        map.rng = streams.for_level(level).mapgen
+        map.generate()
+        levels.append(map)
+    return levels
+
+def make_fov_map(level, engine):
+    fov_map = tcod.Map(level.width, level.height, engine=engine)
+    fov_map.set_all_properties(level.see_through, level.pass_through)
+    return fov_map
+
+def main(argv):
+    parser = OptionParser(usage='%prog [--maps N] [--origins N] [--radius R] [--seed S]')
+    parser.add_option('--maps', type='int', default=20,
+                      help='number of dungeon levels to generate [default: %default]')
+    parser.add_option('--origins', type='int', default=50,
+                      help='viewpoints per level [default: %default]')
+    parser.add_option('--radius', type='int', default=const.FOV_RADIUS,
+                      help='light radius, 0 for unlimited [default: %default]')
+    parser.add_option('--seed', type='int', default=None,
+                      help='seed for the levels and viewpoints')
+    options, args = parser.parse_args(argv)
+
+    engines = [tcod.FOV_ENGINE_PYTHON]
+    if not libtcod.HEADLESS:
+        engines.insert(0, tcod.FOV_ENGINE_LIBTCOD)
+
+    rand = random.Random(options.seed)
+    levels = make_levels(options.maps, options.seed)
+    origins = []
+    for level in levels:
+        floor = [(i % level.width, i // level.width)
+                 for i in range(len(level.pass_through)) if level.pass_through[i]]
+        # Distinct, as tcod.Map would skip recomputing the same field of view
+        origins.append(rand.sample(floor, min(options.origins, len(floor))))
+
+    for name, algorithm in ALGORITHMS:
+        results = {}
+        for engine in engines:
+            elapsed = 0.0
+            results[engine] = []
+            for level, points in zip(levels, origins):
+                fov_map = make_fov_map(level, engine)
+                for x, y in points:
+                    start = time.time()
+                    fov_map.compute_fov(x, y, options.radius, const.FOV_LIGHT_WALLS, algorithm)
+                    elapsed += time.time() - start
+                    results[engine].append(bytes(fov_map.get_fov()))
+
+            count = len(results[engine])
+            print '%-7s %-8s %8.1f us/fov over %d computations' % (
+                name, engine, elapsed * 1e6 / count, count)
+
+        if len(engines) > 1:
+            same = sum(1 for a, b in zip(*[results[e] for e in engines]) if a == b)
+            print '%-7s %d/%d fields of view identical between engines' % (name, same, count)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -5,17 +5,30 @@ LIMIT_FPS = 20
 SCREEN_WIDTH = 80
 SCREEN_HEIGHT = 50
 
+# The part of the screen the map is shown in
+VIEW_WIDTH = 80
+VIEW_HEIGHT = 43
+
+# The size of a dungeon level, which may well be larger than the view
 MAP_WIDTH = 80
 MAP_HEIGHT = 43
 
+# How close the player may get to the edge of the view before it recentres
+CAMERA_MARGIN = 8
+
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
-ROOM_COUNT = 30
+ROOM_COUNT = 30 # at most
+ROOM_ATTEMPTS = 30 # candidate rooms to try placing
 
 FOV_ALGORITHM = 0
 FOV_LIGHT_WALLS = True
 FOV_RADIUS = 10
 
+# How many steps away from the player monsters find their way around walls;
+# further out, they just head straight for the player
+CHASE_RADIUS = 2 * FOV_RADIUS
+
 COLOR_DARK_WALL = tcod.Color(0, 0, 100)
 COLOR_DARK_GROUND = tcod.Color(50, 50, 150)
 COLOR_LIGHT_WALL = tcod.Color(130, 110, 50)
@@ -30,14 +43,20 @@ COLOR_REMAINS = tcod.COLOR_DARK_RED
 
 COLOR_GUI_FOREGROUND = tcod.COLOR_WHITE
 
+# Game time is counted in ticks. An action takes TURN_TIME ticks at
+# SPEED_NORMAL, half that at twice the speed, and so on.
+TURN_TIME = 100
+SPEED_NORMAL = 100
+
 ACTION_NONE = 0
 ACTION_MOVE = 1
 ACTION_EXIT = 2
 ACTION_DESCEND_STAIRS = 3
+ACTION_ASCEND_STAIRS = 4
 
 BAR_WIDTH = 20
 
-PANEL_HEIGHT = SCREEN_HEIGHT - MAP_HEIGHT
+PANEL_HEIGHT = SCREEN_HEIGHT - VIEW_HEIGHT
 PANEL_Y = SCREEN_HEIGHT - PANEL_HEIGHT
 PANEL_BACKGROUND = tcod.COLOR_BLACK
 PANEL_HPBAR_BACK = tcod.COLOR_DARKER_RED
@@ -49,8 +68,10 @@ PANEL_TEXT_COLOR = tcod.COLOR_WHITE
 PANEL_MSG_X = BAR_WIDTH + 2
 MSG_WIDTH = SCREEN_WIDTH - BAR_WIDTH - 2
 MSG_HEIGHT = PANEL_HEIGHT - 1
+MSG_HISTORY = 500 # messages kept for scrolling back through
 
 INVENTORY_WIDTH = 50
+MENU_CACHE_SIZE = 16 # menus kept drawn, ready to be shown again
 
 HEAL_AMOUNT = 40
 
@@ -69,3 +90,9 @@ FIREBALL_RADIUS = 3
 
 LEVEL_UP_BASE = 200
 LEVEL_UP_INCREMENT = 150
+
+SAVE_FILE = 'savegame'
+AUTOSAVE_INTERVAL = 50 # turns
+
+LEVELS_DIR = 'savegame-levels'
+LEVEL_CACHE_SIZE = 4 # levels kept in memory besides the current one
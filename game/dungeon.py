@@ -1,48 +1,110 @@
+import heapq
+
 import tcod
 from game import const, entities, utils
 from game.utils import panel
 
-monster_chances = {entities.make_orc: 80, entities.make_troll: 0}
-item_chances = {entities.make_health_potion: 35, entities.make_lightning_scroll: 0,
-                entities.make_confuse_scroll: 0, entities.make_fireball_scroll: 0}
-
-def make_random_monster(x, y):
-    monster_maker = utils.random_choice(monster_chances)
+# What turns up in rooms: for each kind of monster and item, its chance from
+# the given dungeon level on (see utils.from_level), and how many of them a
+# room holds at most. See spawn_table.
+monster_chances = [(entities.make_orc, {1: 80}),
+                   (entities.make_troll, {3: 15, 5: 30, 7: 60})]
+item_chances = [(entities.make_health_potion, {1: 35}),
+                (entities.make_lightning_scroll, {4: 25}),
+                (entities.make_confuse_scroll, {2: 10}),
+                (entities.make_fireball_scroll, {6: 25})]
+monsters_per_room = {1: 2, 4: 3, 6: 5}
+items_per_room = {1: 1, 4: 2}
+
+# The eight steps a creature can take
+STEPS = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+
+class SpawnTable:
+    """ The tables above, compiled for one dungeon level """
+    def __init__(self, level):
+        self.level = level
+        self.monsters = utils.ChoiceTable([(maker, utils.from_level(chances, level))
+                                           for maker, chances in monster_chances])
+        self.items = utils.ChoiceTable([(maker, utils.from_level(chances, level))
+                                        for maker, chances in item_chances])
+        self.max_monsters = utils.from_level(monsters_per_room, level)
+        self.max_items = utils.from_level(items_per_room) # level 1's, whatever the level
+
+spawn_tables = {} # level -> SpawnTable
+
+def spawn_table(level):
+    """ The SpawnTable for level, compiled the first time it is needed """
+    table = spawn_tables.get(level)
+    if table is None:
+        table = spawn_tables[level] = SpawnTable(level)
+    return table
+
+def make_random_monster(x, y, chances=None, rand=tcod.random):
+    if chances is None:
+        chances = spawn_table(1).monsters
+    monster_maker = chances.choose(rand)
     return monster_maker(x, y)
 
-def make_random_item(x, y):
-    item_maker = utils.random_choice(item_chances)
+def make_random_item(x, y, chances=None, rand=tcod.random):
+    if chances is None:
+        chances = spawn_table(1).items
+    item_maker = chances.choose(rand)
     return item_maker(x, y)
 
-class Tile:
-    def __init__(self, pass_through, see_through = None):
-        self.pass_through = pass_through
-
-        if(see_through is None):
-            see_through = pass_through
-        self.see_through = see_through
-        self.explored = False
+class Tile(object):
+    """
+    A view onto one cell of a Map. The cell data itself lives in the Map's
+    pass_through, see_through and explored byte arrays; this just lets callers
+    keep treating map.tiles[x][y] as an object.
+    """
+    def __init__(self, map, x, y):
+        self.map = map
+        self.x = x
+        self.y = y
+        self.index = y * map.width + x
+
+    def get_pass_through(self):
+        return self.map.pass_through[self.index] != 0
+    def set_pass_through(self, value):
+        self.map.pass_through[self.index] = bool(value)
+    pass_through = property(get_pass_through, set_pass_through)
+
+    def get_see_through(self):
+        return self.map.see_through[self.index] != 0
+    def set_see_through(self, value):
+        self.map.see_through[self.index] = bool(value)
+    see_through = property(get_see_through, set_see_through)
+
+    def get_explored(self):
+        return self.map.explored[self.index] != 0
+    def set_explored(self, value):
+        self.map.explored[self.index] = bool(value)
+    explored = property(get_explored, set_explored)
 
     def render(self, x, y, map):
-        is_visible = map.is_visible(x, y)
-        is_wall = not self.pass_through
+        map.render_cell(x, y)
 
-        color = const.COLOR_DARKNESS
-        if is_visible:
-            self.explored = True
-            if is_wall:
-                color = const.COLOR_LIGHT_WALL
-            else:
-                color = const.COLOR_LIGHT_GROUND
-        else: # not in fov
-            if not self.explored:
-                color = const.COLOR_DARKNESS
-            elif is_wall:
-                color = const.COLOR_DARK_WALL
-            else:
-                color = const.COLOR_DARK_GROUND
+class TileColumn(object):
+    def __init__(self, map, x):
+        self.map = map
+        self.x = x
+
+    def __len__(self):
+        return self.map.height
+
+    def __getitem__(self, y):
+        return Tile(self.map, self.x, y)
+
+class TileGrid(object):
+    """ map.tiles[x][y] compatibility view over a Map's tile arrays """
+    def __init__(self, map):
+        self.map = map
 
-        map.console.set_char_background(x, y, color)
+    def __len__(self):
+        return self.map.width
+
+    def __getitem__(self, x):
+        return TileColumn(self.map, x)
 
 class Room(utils.Rect):
     def __init__(self, map):
@@ -51,106 +113,399 @@ class Room(utils.Rect):
 
     def generate(self, x=None, y=None, w=None, h=None):
         if w is None:
-            w = tcod.random.get_int(const.ROOM_MIN_SIZE, const.ROOM_MAX_SIZE)
+            w = self.map.rng.get_int(const.ROOM_MIN_SIZE, const.ROOM_MAX_SIZE)
         if h is None:
-            h = tcod.random.get_int(const.ROOM_MIN_SIZE, const.ROOM_MAX_SIZE)
+            h = self.map.rng.get_int(const.ROOM_MIN_SIZE, const.ROOM_MAX_SIZE)
         if x is None:
-            x = tcod.random.get_int(self.map.width - w - 1)
+            x = self.map.rng.get_int(self.map.width - w - 1)
         if y is None:
-            y = tcod.random.get_int(self.map.height - h - 1)
+            y = self.map.rng.get_int(self.map.height - h - 1)
 
         utils.Rect.__init__(self, x, y, w, h)
 
     def populate(self):
-        max_monsters = utils.from_level({1: 2, 4: 3, 6: 5}, self.map.level)
-        monster_count = tcod.random.get_int(max_monsters)
+        spawns = self.map.spawn_table
+        monster_count = self.map.spawn_rng.get_int(spawns.max_monsters)
 
         for i in range(monster_count):
-            x = tcod.random.get_int(self.x1+1, self.x2-1)
-            y = tcod.random.get_int(self.y1+1, self.y2-1)
+            x = self.map.spawn_rng.get_int(self.x1+1, self.x2-1)
+            y = self.map.spawn_rng.get_int(self.y1+1, self.y2-1)
 
-            monster = make_random_monster(x, y)
+            monster = make_random_monster(x, y, spawns.monsters, self.map.spawn_rng)
             if monster.can_pass(0, 0, self.map):
                 self.map.add_entity(monster)
 
-        max_items = utils.from_level({1: 1, 4: 2})
-        item_count = tcod.random.get_int(max_items)
+        item_count = self.map.spawn_rng.get_int(spawns.max_items)
 
         for i in range(item_count):
-            x = tcod.random.get_int(self.x1+1, self.x2-1)
-            y = tcod.random.get_int(self.y1+1, self.y2-1)
+            x = self.map.spawn_rng.get_int(self.x1+1, self.x2-1)
+            y = self.map.spawn_rng.get_int(self.y1+1, self.y2-1)
 
-            item = make_random_item(x, y)
+            item = make_random_item(x, y, spawns.items, self.map.spawn_rng)
             if item.can_pass(0, 0, self.map):
                 self.map.add_entity(item)
                 self.map.entity_to_bottom(item)
 
     def carve(self):
-        for x in range(self.x1 + 1, self.x2 - 1):
-            for y in range(self.y1 + 1, self.y2 - 1):
-                self.map.tiles[x][y].pass_through = True
-                self.map.tiles[x][y].see_through = True
+        self.map.carve_rect(self.x1 + 1, self.y1 + 1, self.x2 - 1, self.y2 - 1)
 
     def __str__(self):
         return 'Room at ((%d, %d)-(%d, %d))' % (self.x1, self.y1, self.x2, self.y2)
 
 
 class Map:
-    def __init__(self, console, level=1):
-        self.tiles = [[Tile(False) for y in range(console.height)] for x in range(console.width)]
+    """
+    A dungeon level of width x height cells. It is shown on console through a
+    camera: the console-sized window whose top left corner is at (camera_x,
+    camera_y) on the map, which follows the player around. Only that window
+    is ever rendered, so a large map costs no more to draw than a small one.
+    """
+    def __init__(self, console, level=1, width=const.MAP_WIDTH, height=const.MAP_HEIGHT):
+        # Tile layers, one byte per cell, indexed [y * width + x]
+        self.pass_through = bytearray(width * height)
+        self.see_through = bytearray(width * height)
+        self.explored = bytearray(width * height)
+        self.tiles = TileGrid(self)
+        # Visibility as of the last compute_fov, and the rows it may cover
+        self.visible = bytearray(width * height)
+        self.fov_rows = (0, 0)
         self.rooms = []
         self.entities = []
+        self.entity_cells = {} # (x, y) -> entities in that cell, bottom first
+        # Entities with an AI, each with a number breaking ties in turn order,
+        # and those of them that currently have anything to do, with the game
+        # time of their next action; see pass_time
+        self.actors = {}
+        self.actor_count = 0
+        self.awake = {}
+        # The game time on this level, in ticks (see const.TURN_TIME), the
+        # times at which actors are due (a heap, soonest first) and, for each,
+        # the (order, entity) due then. Entries whose time no longer matches
+        # awake are stale, and skipped.
+        self.time = 0
+        self.schedule = []
+        self.due = {}
+        # The (time, order) of the actor thinking, while pass_time runs
+        self.turn = None
         self.console = console
-        self.fov_map = tcod.Map(console.width, console.height)
-        self.width = console.width
-        self.height = console.height
+        self.fov_map = tcod.Map(width, height)
+        self.width = width
+        self.height = height
+        self.camera_x = 0
+        self.camera_y = 0
+        # The rendered view, painted onto the console in one go
+        self.frame = tcod.ConsoleBuffer(console.width, console.height)
+        # Indices of cells that need repainting on the next render
+        self.mark_all_dirty()
         self.fullbright = False
         self.player = None
         self.level = level
         self.stairs = None
-
-        monster_chances[entities.make_troll] = utils.from_level({3: 15, 5: 30, 7: 60}, level)
-        item_chances[entities.make_lightning_scroll] = utils.from_level({4: 25}, level)
-        item_chances[entities.make_confuse_scroll] = utils.from_level({2: 10}, level)
-        item_chances[entities.make_fireball_scroll] = utils.from_level({6: 25}, level)
+        self.upstairs = None
+        # Steps to the player from each cell within CHASE_RADIUS of them, and
+        # the player position it was worked out for; see chase_field
+        self.chase_distance = {}
+        self.chase_key = None
+        # What generate and populate_rooms roll with; see levels.generate
+        self.rng = tcod.random
+        self.spawn_rng = tcod.random
+
+        # What populate_rooms places here
+        self.spawn_table = spawn_table(level)
 
     def is_visible(self, x, y):
         if self.fullbright:
             return True
         else:
-            return self.fov_map.is_in_fov(x, y)
+            return self.visible[y * self.width + x] != 0
+
+    def set_fullbright(self, fullbright):
+        self.fullbright = fullbright
+        self.mark_all_dirty()
+        if fullbright:
+            for e in self.actors:
+                self.wake(e)
+
+    def mark_dirty(self, x, y):
+        self.dirty.add(y * self.width + x)
+
+    def mark_all_dirty(self):
+        """ Have the next render repaint the whole view """
+        x1 = self.camera_x
+        x2 = min(self.camera_x + self.console.width, self.width)
+        self.dirty = set()
+        for y in range(self.camera_y, min(self.camera_y + self.console.height, self.height)):
+            self.dirty.update(range(y * self.width + x1, y * self.width + x2))
+
+    def update_camera(self):
+        """ Recentre the view on the player once they get within
+        CAMERA_MARGIN cells of its edge, as far as the map's edges allow.
+
+        """
+        if self.player is None:
+            return
+
+        x = self.follow(self.camera_x, self.player.x, self.console.width, self.width)
+        y = self.follow(self.camera_y, self.player.y, self.console.height, self.height)
+        if (x, y) != (self.camera_x, self.camera_y):
+            self.camera_x = x
+            self.camera_y = y
+            self.mark_all_dirty()
+
+    def follow(self, camera, target, view_size, map_size):
+        if target < camera + const.CAMERA_MARGIN or target >= camera + view_size - const.CAMERA_MARGIN:
+            camera = target - view_size / 2
+        return max(0, min(camera, map_size - view_size))
+
+    def screen_to_map(self, cx, cy):
+        """ The map cell shown at (cx, cy) on the console, or (None, None) """
+        if cx < 0 or cy < 0 or cx >= self.console.width or cy >= self.console.height:
+            return (None, None)
+        x = cx + self.camera_x
+        y = cy + self.camera_y
+        if x >= self.width or y >= self.height:
+            return (None, None)
+        return (x, y)
+
+    def compute_fov(self, x, y, radius, light_walls, algorithm):
+        """ Recompute the field of view from (x, y), marking every cell whose
+        visibility changed as dirty, and every cell now in view as explored.
+        Only the rows the old and new fields of view can reach are compared,
+        whole, so only rows that actually changed are walked cell by cell.
+        Does nothing if the field of view did not need recomputing.
+
+        """
+        if not self.fov_map.compute_fov(x, y, radius, light_walls, algorithm):
+            return
+
+        if radius > 0:
+            rows = (max(0, y - radius), min(self.height, y + radius + 1))
+        else:
+            rows = (0, self.height)
+        first = min(rows[0], self.fov_rows[0])
+        last = max(rows[1], self.fov_rows[1])
+        self.fov_rows = rows
+
+        fov = self.fov_map.get_fov()
+        for start in range(first * self.width, last * self.width, self.width):
+            end = start + self.width
+            if fov[start:end] == self.visible[start:end]:
+                continue
+            for i in range(start, end):
+                if fov[i] != self.visible[i]:
+                    self.dirty.add(i)
+                    if fov[i]:
+                        self.explored[i] = True
+                        self.wake_at(i % self.width, i // self.width)
+            self.visible[start:end] = fov[start:end]
 
     def is_explored(self, x, y):
-        return self.tiles[x][y].explored
+        return self.explored[y * self.width + x] != 0
+
+    def is_pass_through(self, x, y):
+        return self.pass_through[y * self.width + x] != 0
 
     def add_entity(self, entity):
         self.entities.append(entity)
+        self.cell_add(entity)
         entity.map = self
+        if entity.ai is not None:
+            self.actors[entity] = self.actor_count
+            self.actor_count += 1
+            if self.is_visible(entity.x, entity.y):
+                self.wake(entity)
 
     def add_entity_to_bottom(self, entity):
         self.entities.insert(0, entity)
+        self.cell_add(entity, bottom=True)
         entity.map = self
 
     def entity_to_bottom(self, entity):
         if entity in self.entities:
             self.entities.remove(entity)
             self.entities.insert(0, entity)
+            self.cell_remove(entity)
+            self.cell_add(entity, bottom=True)
 
     def remove_entity(self, entity):
         if entity in self.entities:
             self.entities.remove(entity)
-            entity.clear(self.console)
+            self.cell_remove(entity)
+        self.actors.pop(entity, None)
+        self.awake.pop(entity, None)
+
+    def wake(self, entity):
+        if entity in self.awake:
+            return
+        order = self.actors[entity]
+        if self.turn is None or (self.time, order) > self.turn:
+            self.schedule_turn(entity, self.time)
+        else:
+            # woken after its turn would have come, it acts one action later
+            self.schedule_turn(entity, self.time + entity.action_time())
+
+    def wake_at(self, x, y):
+        for e in self.entity_cells.get((x, y), ()):
+            if e in self.actors:
+                self.wake(e)
+
+    def schedule_turn(self, entity, time):
+        self.awake[entity] = time
+        due = self.due.get(time)
+        if due is None:
+            due = self.due[time] = []
+            heapq.heappush(self.schedule, time)
+        due.append((self.actors[entity], entity))
+
+    def pass_time(self, duration):
+        """ Let duration ticks of game time go by, letting every awake actor
+        think whenever its next action comes due, soonest (and among equals,
+        first to come onto the map) first. After thinking, an actor's next
+        action is due action_time() later, unless it has nothing left to do,
+        in which case it goes to sleep until woken. Actors are woken when the
+        player comes to see them (see compute_fov), so sleeping ones cost
+        nothing, and neither do awake ones in between their actions.
+
+        """
+        end = self.time + duration
+        while self.schedule and self.schedule[0] < end:
+            self.time = heapq.heappop(self.schedule)
+            self.take_turns(self.time)
+        self.time = end
+        self.turn = None
+
+    def take_turns(self, time):
+        """ Let the actors due at time think, in turn order """
+        batch = self.due.pop(time, None)
+        if batch is None:
+            return
+        batch.sort()
+
+        awake, actors = self.awake, self.actors
+        next_time = next_due = None
+        i = 0
+        while i < len(batch):
+            if time in self.due:
+                # woken by an earlier actor, and due before these turns are over
+                batch[i:] = sorted(batch[i:] + self.due.pop(time))
+            order, e = batch[i]
+            i += 1
+            if awake.get(e) != time or actors.get(e) != order:
+                continue # stale
+            self.turn = (time, order)
+            del awake[e]
+
+            if e.ai is not None:
+                e.ai.think()
+            if e.ai is None:
+                actors.pop(e, None) # dead
+            elif e in actors and e not in awake and e.ai.is_awake():
+                # schedule_turn, for the common case of many actors being due
+                # at the same time next
+                t = time + e.action_time()
+                if t != next_time:
+                    next_time = t
+                    next_due = self.due.get(t)
+                    if next_due is None:
+                        next_due = self.due[t] = []
+                        heapq.heappush(self.schedule, t)
+                awake[e] = t
+                next_due.append((order, e))
+
+    def move_entity(self, entity, x, y):
+        """ Move an entity on this map, keeping the per-cell index current """
+        self.cell_remove(entity)
+        entity.x = x
+        entity.y = y
+        self.cell_add(entity)
+
+    def cell_add(self, entity, bottom=False):
+        self.mark_dirty(entity.x, entity.y)
+        cell = self.entity_cells.setdefault((entity.x, entity.y), [])
+        if bottom:
+            cell.insert(0, entity)
+        else:
+            cell.append(entity)
+
+    def cell_remove(self, entity):
+        self.mark_dirty(entity.x, entity.y)
+        key = (entity.x, entity.y)
+        cell = self.entity_cells.get(key)
+        if cell is not None and entity in cell:
+            cell.remove(entity)
+            if len(cell) == 0:
+                del self.entity_cells[key]
 
     def entities_at(self, x, y, only_visible=False):
         if only_visible and not self.is_visible(x, y):
             return []
 
-        return [e for e in self.entities
-                if e.x == x and e.y == y]
+        return list(self.entity_cells.get((x, y), ()))
 
     def targets_at(self, x, y, only_visible=False):
         return [e for e in self.entities_at(x, y, only_visible) if e.fighter]
 
+    def chase_field(self):
+        """ Map of cell index to the number of steps to the player, for every
+        cell within CHASE_RADIUS steps of them, by a breadth-first flood fill
+        over the floor. It is shared by every monster, and only redone when
+        the player moves.
+
+        """
+        key = (self.player.x, self.player.y)
+        if self.chase_key == key:
+            return self.chase_distance
+
+        width, height, pass_through = self.width, self.height, self.pass_through
+        start = self.player.y * width + self.player.x
+        distance = {start: 0}
+        frontier = [start]
+        for steps in range(1, const.CHASE_RADIUS + 1):
+            next_frontier = []
+            for i in frontier:
+                x, y = i % width, i // width
+                for dx, dy in STEPS:
+                    nx, ny = x + dx, y + dy
+                    if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                        continue
+                    n = ny * width + nx
+                    if n not in distance and pass_through[n]:
+                        distance[n] = steps
+                        next_frontier.append(n)
+            frontier = next_frontier
+
+        self.chase_distance = distance
+        self.chase_key = key
+        return distance
+
+    def chase_step(self, entity):
+        """ The step (dx, dy) that brings entity closest to the player along
+        the floor, or None if it is out of reach of the chase field or every
+        step closer is blocked. Between equally good steps, the one closest
+        to the player as the crow flies wins.
+
+        """
+        field = self.chase_field()
+        here = field.get(entity.y * self.width + entity.x)
+        if here is None:
+            return None
+
+        best = None
+        for dx, dy in STEPS:
+            x, y = entity.x + dx, entity.y + dy
+            if x < 0 or y < 0 or x >= self.width or y >= self.height:
+                continue
+            steps = field.get(y * self.width + x)
+            if steps is None or steps >= here or not entity.can_pass(dx, dy):
+                continue
+            rank = (steps, (self.player.x - x)**2 + (self.player.y - y)**2)
+            if best is None or rank < best[0]:
+                best = (rank, (dx, dy))
+
+        if best is None:
+            return None
+        return best[1]
+
     def entities_near(self, x, y, max_range):
         return [e for e in self.entities
                 if e.distance(x, y) <= max_range]
@@ -172,49 +527,116 @@ class Map:
 
         return nearest_target
 
+    def render_cell(self, x, y):
+        sx = x - self.camera_x
+        sy = y - self.camera_y
+        if sx < 0 or sy < 0 or sx >= self.console.width or sy >= self.console.height:
+            return # out of view
+
+        i = y * self.width + x
+        is_visible = self.is_visible(x, y)
+        is_wall = not self.pass_through[i]
+
+        color = const.COLOR_DARKNESS
+        if is_visible:
+            self.explored[i] = True
+            if is_wall:
+                color = const.COLOR_LIGHT_WALL
+            else:
+                color = const.COLOR_LIGHT_GROUND
+        else: # not in fov
+            if not self.explored[i]:
+                color = const.COLOR_DARKNESS
+            elif is_wall:
+                color = const.COLOR_DARK_WALL
+            else:
+                color = const.COLOR_DARK_GROUND
+
+        self.frame.set_back(sx, sy, color.r, color.g, color.b)
+
+        # the topmost entity that can be seen gets drawn, if any
+        for e in reversed(self.entity_cells.get((x, y), ())):
+            if e.is_shown():
+                self.frame.set_fore(sx, sy, e.color.r, e.color.g, e.color.b, e.char)
+                break
+        else:
+            self.frame.set_fore(sx, sy, 0, 0, 0, ' ')
+
     def render(self):
-        for x in range(len(self.tiles)):
-            for y in range(len(self.tiles[x])):
-                self.tiles[x][y].render(x, y, self)
+        """ Move the camera if need be, update the frame buffer for the cells
+        in view marked dirty since the last render, then paint the whole
+        console from it in one go. Nothing is painted if nothing changed.
+
+        """
+        self.update_camera()
+        if len(self.dirty) == 0:
+            return
+
+        dirty = self.dirty
+        self.dirty = set()
+        for i in dirty:
+            self.render_cell(i % self.width, i // self.width)
+
+        self.console.draw_buffer(self.frame)
 
-        for e in self.entities:
-            e.draw(self.console)
+    def generate(self, room_count=const.ROOM_COUNT, attempts=const.ROOM_ATTEMPTS):
+        """ Place up to room_count rooms, trying at most attempts random
+        candidates, then tunnel them together.
 
-    def post_render(self):
-        for e in self.entities:
-            e.clear(self.console)
+        """
+        # Every cell taken by a room so far, walls included (a room spans
+        # [x1, x2] x [y1, y2], as Rect.intersects sees it), so a candidate is
+        # checked against the grid rather than against every other room
+        stride = self.width + 1
+        occupied = bytearray(stride * (self.height + 1))
+
+        for unused in range(attempts):
+            if len(self.rooms) >= room_count:
+                break
 
-    def generate(self):
-        for unused in range(const.ROOM_COUNT):
             new_room = Room(self)
             new_room.generate()
+            span = new_room.x2 - new_room.x1 + 1
+            rows = range(new_room.y1 * stride + new_room.x1, new_room.y2 * stride + new_room.x1 + 1, stride)
+
             is_overlapping = False
-            for other_room in self.rooms:
-                if new_room.intersects(other_room):
+            for start in rows:
+                if occupied.find(b'\x01', start, start + span) != -1:
                     is_overlapping = True
                     break
 
             if is_overlapping: continue # forget this room, make a new one
 
+            taken = b'\x01' * span
+            for start in rows:
+                occupied[start:start + span] = taken
             self.rooms.append(new_room)
         self.carve_rooms()
         self.init_fov()
 
     def init_fov(self):
-        for x in range(len(self.tiles)):
-            for y in range(len(self.tiles[x])):
-                tile = self.tiles[x][y]
-                self.fov_map.set_properties(x, y, tile.see_through, tile.pass_through)
+        self.fov_map.set_all_properties(self.see_through, self.pass_through)
+
+    def carve_rect(self, x1, y1, x2, y2):
+        """ Open up every cell in [x1, x2) x [y1, y2), one row slice at a time """
+        if x2 <= x1:
+            return
+        floor = b'\x01' * (x2 - x1)
+        for y in range(y1, y2):
+            start = y * self.width
+            self.pass_through[start + x1:start + x2] = floor
+            self.see_through[start + x1:start + x2] = floor
 
     def carve_h_tunnel(self, x1, x2, y):
-        for x in range(min(x1, x2), max(x1, x2) + 1):
-            self.tiles[x][y].pass_through = True
-            self.tiles[x][y].see_through = True
+        self.carve_rect(min(x1, x2), y, max(x1, x2) + 1, y + 1)
 
     def carve_v_tunnel(self, x, y1, y2):
-        for y in range(min(y1, y2), max(y1, y2) + 1):
-            self.tiles[x][y].pass_through = True
-            self.tiles[x][y].see_through = True
+        # a column is every width-th byte, so carve it as one strided slice
+        top, bottom = min(y1, y2), max(y1, y2)
+        floor = b'\x01' * (bottom - top + 1)
+        column = slice(top * self.width + x, bottom * self.width + x + 1, self.width)
+        self.pass_through[column] = floor
+        self.see_through[column] = floor
 
     def carve_rooms(self):
         for i in range(len(self.rooms)):
@@ -225,7 +647,7 @@ class Map:
             start_point = self.rooms[i-1].center()
             end_point = self.rooms[i].center()
 
-            if tcod.random.get_int(20) >= 12: # slight bias is intended
+            if self.rng.get_int(20) >= 12: # slight bias is intended
                 self.carve_h_tunnel(start_point.x, end_point.x, start_point.y)
                 self.carve_v_tunnel(end_point.x, start_point.y, end_point.y)
             else:
@@ -243,6 +665,13 @@ class Map:
         self.add_entity_to_bottom(stairs)
         self.stairs = stairs
 
+        # and below the first level, the first room gets the way back up
+        if self.level > 1:
+            center = self.rooms[0].center()
+            upstairs = entities.Entity(center.x, center.y, '>', 'a staircase leading up', tcod.COLOR_WHITE, always_visible=True)
+            self.add_entity_to_bottom(upstairs)
+            self.upstairs = upstairs
+
     def label_rooms(self):
         labels = utils.label_generator('A')
         for r in self.rooms:
@@ -1,7 +1,7 @@
 import math
 
 import tcod
-from game import const, utils
+from game import const, rng, utils
 panel = utils.panel
 
 class Entity:
@@ -18,13 +18,17 @@ class Entity:
         self.always_visible = always_visible
         self.fighter = None
         self.ai = None
+        self.speed = const.SPEED_NORMAL
+
+    def action_time(self, turns=1):
+        """ Game time, in ticks, that self takes to act turns times over """
+        return max(1, turns * const.TURN_TIME * const.SPEED_NORMAL // self.speed)
 
     def can_pass(self, dx, dy, the_map=None):
         if the_map is None:
             the_map = self.map
 
-        cell = the_map.tiles[self.x + dx][self.y + dy]
-        if not cell.pass_through:
+        if not the_map.is_pass_through(self.x + dx, self.y + dy):
             return False
 
         for e in the_map.entities_at(self.x + dx, self.y + dy):
@@ -36,8 +40,7 @@ class Entity:
     def move(self, dx, dy):
         """ Move by dx in the X direction and by dy in the Y direction """
         if self.can_pass(dx, dy):
-            self.x += dx
-            self.y += dy
+            self.map.move_entity(self, self.x + dx, self.y + dy)
 
         for f in self.on_move:
             f(self, self.x + dx, self.y + dy)
@@ -61,16 +64,10 @@ class Entity:
     def distance(self, x, y):
         return math.sqrt((x - self.x)**2 + (y - self.y)**2)
 
-    def draw(self, console):
-        """ Draw self to the passed-in console """
-        if((self.always_visible and self.map.is_explored(self.x, self.y)) or
-           self.map.is_visible(self.x, self.y)):
-            console.set_default_foreground(self.color)
-            console.put_char(self.x, self.y, self.char)
-
-    def clear(self, console):
-        """ Remove self from the passed-in console """
-        console.put_char(self.x, self.y, ' ')
+    def is_shown(self):
+        """ Whether self should be drawn, given what the player can see """
+        return ((self.always_visible and self.map.is_explored(self.x, self.y)) or
+                self.map.is_visible(self.x, self.y))
 
 class EntityItem(Entity):
     def __init__(self, x, y, char, name, color, item=None):
@@ -142,6 +139,10 @@ class Fighter:
             self.hp = self.max_hp
 
 class BasicMonster:
+    def is_awake(self):
+        """ Whether think would do anything; see Map.pass_time """
+        return self.owner.map.is_visible(self.owner.x, self.owner.y)
+
     def think(self):
         map = self.owner.map
 
@@ -150,7 +151,11 @@ class BasicMonster:
             return # nothing to do here, moving on.
 
         if self.owner.distance_to(map.player) >= 2:
-            self.owner.move_towards(map.player.x, map.player.y)
+            step = map.chase_step(self.owner)
+            if step is None:
+                self.owner.move_towards(map.player.x, map.player.y)
+            else:
+                self.owner.move(*step)
         elif map.player.fighter.hp > 0:
             self.owner.fighter.attack(map.player)
 
@@ -159,9 +164,12 @@ class ConfusedMonster(BasicMonster):
         self.old_ai = old_ai
         self.duration = duration
 
+    def is_awake(self):
+        return True
+
     def think(self):
         if self.duration > 0:
-            self.owner.move(tcod.random.get_int(-1, 1), tcod.random.get_int(-1, 1))
+            self.owner.move(rng.streams.ai.get_int(-1, 1), rng.streams.ai.get_int(-1, 1))
             self.duration -= 1
         else:
             self.owner.ai = self.old_ai
@@ -181,11 +189,10 @@ class Item:
             panel.add_message('You picked up ' + self.owner.name + '.', tcod.COLOR_GREEN)
 
     def drop(self, dropper):
-        dropper.map.add_entity(self.owner)
-        dropper.map.entity_to_bottom(self.owner)
-        dropper.inventory.remove(self.owner)
         self.owner.x = dropper.x
         self.owner.y = dropper.y
+        dropper.map.add_entity_to_bottom(self.owner)
+        dropper.inventory.remove(self.owner)
         panel.add_message('You drop ' + self.owner.name + '.', tcod.COLOR_YELLOW)
 
     def use(self, user):
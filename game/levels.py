@@ -0,0 +1,141 @@
+"""
+Keeping the dungeon levels the player has left, so they can go back to them.
+
+Every level left behind is written to its own small save file (see
+savefile.py) in the store's directory, and the most recently left ones are
+also kept in memory, up to a fixed number, so that hopping up and down a
+staircase doesn't reload anything. Older levels are simply dropped from
+memory and read back from disk when revisited, so memory use does not grow
+with the depth reached.
+
+Pregenerator builds the level below the current one on a worker thread, so
+that it is ready by the time the player finds the stairs.
+"""
+import collections
+import os
+import threading
+
+from game import const, dungeon, rng, savefile
+
+def generate(console, level, streams=None, width=const.MAP_WIDTH, height=const.MAP_HEIGHT):
+    """ Build and populate a new dungeon level, rolling with streams (by
+    default, the game's streams for that level; see rng.Streams.for_level).
+
+    """
+    if streams is None:
+        streams = rng.streams.for_level(level)
+    map = dungeon.Map(console, level=level, width=width, height=height)
+    map.rng = streams.mapgen
+    map.spawn_rng = streams.spawns
+    map.generate()
+    map.populate_rooms()
+    return map
+
+class LevelStore:
+    def __init__(self, console, path, saver, budget):
+        self.console = console
+        self.path = path
+        self.saver = saver # a savefile.Autosaver, which writes the level files
+        self.budget = budget
+        self.cache = collections.OrderedDict() # level -> Map, least recent first
+        self.stored = set(self.stored_levels()) # levels written, or on their way
+
+    def set_path(self, path):
+        """ Keep levels in the directory at path from now on """
+        self.cache.clear()
+        self.path = path
+        self.stored = set(self.stored_levels())
+
+    def level_file(self, level):
+        return os.path.join(self.path, 'level%d' % level)
+
+    def stored_levels(self):
+        """ The levels with files in the store's directory """
+        if not os.path.isdir(self.path):
+            return []
+        return [int(name[len('level'):]) for name in os.listdir(self.path)
+                if name.startswith('level') and name[len('level'):].isdigit()]
+
+    def put(self, map):
+        """ Store a level the player (who must be off it by now) is leaving """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.saver.save(map, [], self.level_file(map.level))
+        self.stored.add(map.level)
+
+        self.cache.pop(map.level, None)
+        self.cache[map.level] = map
+        while len(self.cache) > self.budget:
+            self.cache.popitem(last=False)
+
+    def has(self, level):
+        """ Whether level was visited before """
+        return level in self.cache or level in self.stored
+
+    def get(self, level):
+        """ Take a stored level back out, or None if it was never visited """
+        map = self.cache.pop(level, None)
+        if map is not None:
+            map.mark_all_dirty()
+            return map
+
+        path = self.level_file(level)
+        if level not in self.stored:
+            return None
+        # It may still be on its way to the disk, or have failed to get there
+        if self.saver.wait(path) is not None or not os.path.exists(path):
+            return None
+        map, unused, unused = savefile.load(path, self.console)
+        return map
+
+    def clear(self):
+        """ Forget every level, in memory and on disk """
+        self.cache.clear()
+        self.stored.clear()
+        self.saver.wait()
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+
+class Pregenerator:
+    def __init__(self, console):
+        self.console = console
+        self.job = None
+
+    def start(self, level):
+        """ Start building level in the background, unless it already is """
+        if self.is_building(level):
+            return
+
+        # The level's streams are its own, so the worker never rolls the same
+        # dice as the game, and builds the very level take() would have
+        streams = rng.streams.for_level(level)
+        job = {'seed': rng.streams.seed, 'level': level, 'map': None}
+        job['thread'] = threading.Thread(target=self.run, args=(job, streams), name='pregenerate')
+        job['thread'].daemon = True
+        job['thread'].start()
+        self.job = job
+
+    def is_building(self, level):
+        """ Whether the job underway is level, in the game being played """
+        return (self.job is not None and self.job['level'] == level and
+                self.job['seed'] == rng.streams.seed)
+
+    def run(self, job, streams):
+        try:
+            job['map'] = generate(self.console, job['level'], streams)
+        except Exception:
+            pass # take() will build the level itself, and raise the error there
+
+    def take(self, level):
+        """ Return a new level, waiting for the worker to finish it if it is
+        already underway, or building it right here otherwise.
+
+        """
+        building = self.is_building(level)
+        job, self.job = self.job, None
+        if building:
+            job['thread'].join()
+            if job['map'] is not None:
+                return job['map']
+        return generate(self.console, level)
@@ -0,0 +1,82 @@
+"""
+The game's random number streams.
+
+Each part of the game rolls its own dice, so that, say, a monster stumbling
+about in confusion doesn't change what the next level will look like:
+
+    mapgen  - dungeon layout: rooms and tunnels
+    spawns  - which monsters and items are placed where
+    ai      - monster behaviour
+    combat  - fights
+
+A Streams holds one tcod.Random for each, all derived from a single seed, so
+a game is reproduced by its seed alone. Levels get streams of their own,
+derived from the game's seed and the level number (see for_level), so a
+level comes out the same whenever and wherever it is generated.
+
+Where a game stands is the seed plus how many numbers each stream has given
+out (see Streams.save), which is what save files keep.
+
+`streams` is the set the game is currently playing with; seed() and
+restore() replace it.
+"""
+import random
+import zlib
+
+import tcod
+
+NAMES = ('mapgen', 'spawns', 'ai', 'combat')
+
+MAX_SEED = 0x7fffffff
+
+class Streams:
+    def __init__(self, seed=None, engine=tcod.RANDOM_ENGINE_LIBTCOD):
+        if seed is None:
+            seed = random.SystemRandom().randint(0, MAX_SEED)
+        self.seed = seed
+        self.engine = engine
+
+        master = tcod.Random(seed=seed, engine=engine)
+        for name in NAMES:
+            setattr(self, name, tcod.Random(seed=master.get_int(0, MAX_SEED), engine=engine))
+
+    def for_level(self, level):
+        """ The streams to generate dungeon level number level with """
+        return Streams(zlib.crc32('%d/%d' % (self.seed, level)) & MAX_SEED, self.engine)
+
+    def save(self):
+        """ The state of every stream, for restore(): (seed, the number of
+        numbers drawn from each stream in NAMES).
+
+        """
+        return (self.seed, tuple(getattr(self, name).draws for name in NAMES))
+
+    def restore(self, state):
+        """ Put every stream back where it was when state was saved from
+        streams with the same seed.
+
+        """
+        seed, draws = state
+        if seed != self.seed:
+            raise ValueError('State of the streams of seed %d, not %d' % (seed, self.seed))
+        for name, count in zip(NAMES, draws):
+            stream = getattr(self, name)
+            if stream.draws > count:
+                stream = tcod.Random(seed=stream.seed, engine=self.engine)
+                setattr(self, name, stream)
+            stream.skip(count - stream.draws)
+
+streams = Streams()
+
+def seed(game_seed=None):
+    """ Start the game's streams afresh from game_seed (a random one if None) """
+    global streams
+    streams = Streams(game_seed)
+    return streams
+
+def restore(state):
+    """ Carry on with the game's streams from state (see Streams.save) """
+    global streams
+    streams = Streams(state[0])
+    streams.restore(state)
+    return streams
@@ -0,0 +1,458 @@
+"""
+Compact binary save files.
+
+A save file is a small uncompressed header followed by a zlib-compressed
+body holding the state of the game's random streams and the dungeon level: its rooms, its tile layers packed eight cells
+to a byte, a table of every entity (those on the map, then those carried in
+inventories), and the message log. Entities refer to each other by their
+index in the table.
+
+Callbacks (on_death, on_use, on_move, ...) are stored by name, so every
+function that can end up in one must be registered with register_callbacks.
+
+Files are written to a temporary name and then moved over the old save, so a
+crash mid-write leaves the previous save intact. Autosaver does the writing
+on a worker thread.
+"""
+import os
+import struct
+import threading
+import zlib
+
+import tcod
+from game import dungeon, entities, rng
+
+MAGIC = 'RLSV'
+VERSION = 5
+FLAG_COMPRESSED = 1
+
+HEADER = struct.Struct('<4sBBHH')
+
+# The numbers drawn from each of the game's random streams (see rng.Streams.save)
+STREAMS_FORMAT = 'Q' * len(rng.NAMES)
+
+# Entity kinds in the entity table
+KIND_ENTITY = 0
+KIND_ITEM = 1
+KIND_LIVING = 2
+
+# Entity flags
+ENTITY_BLOCKS = 1
+ENTITY_ALWAYS_VISIBLE = 2
+ENTITY_ON_MAP = 4
+
+# AI kinds
+AI_NONE = 0
+AI_BASIC = 1
+AI_CONFUSED = 2
+
+callbacks = {}
+
+def register_callbacks(*funcs):
+    for f in funcs:
+        callbacks[f.__name__] = f
+
+register_callbacks(entities.monster_death, entities.use_health_potion, entities.cast_lightning,
+                   entities.cast_confuse, entities.cast_fireball)
+
+# Packing 0/1 cells eight to a byte, and back, through lookup tables
+UNPACKED = [''.join(chr((value >> bit) & 1) for bit in range(8)) for value in range(256)]
+PACKED = dict((cells, value) for value, cells in enumerate(UNPACKED))
+
+def pack_bits(layer):
+    cells = str(layer)
+    cells += '\0' * (-len(cells) % 8)
+    return ''.join(chr(PACKED[cells[i:i + 8]]) for i in range(0, len(cells), 8))
+
+def unpack_bits(data, count):
+    return bytearray(''.join(UNPACKED[ord(c)] for c in data)[:count])
+
+class Writer:
+    def __init__(self):
+        self.parts = []
+
+    def pack(self, fmt, *values):
+        self.parts.append(struct.pack('<' + fmt, *values))
+
+    def string(self, text):
+        self.pack('H', len(text))
+        self.parts.append(text)
+
+    def color(self, rgb):
+        self.pack('BBB', *rgb)
+
+    def callback(self, func):
+        if func is None:
+            self.string('')
+        else:
+            self.string(func.__name__)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+class Reader:
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        fmt = '<' + fmt
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def raw(self, length):
+        data = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return data
+
+    def string(self):
+        length, = self.unpack('H')
+        return self.raw(length)
+
+    def color(self):
+        return tcod.Color(*self.unpack('BBB'))
+
+    def callback(self):
+        name = self.string()
+        if name == '':
+            return None
+        if name not in callbacks:
+            raise ValueError('Save file refers to unknown callback %s' % name)
+        return callbacks[name]
+
+def capture_ai(ai):
+    if ai is None:
+        return (AI_NONE,)
+    elif isinstance(ai, entities.ConfusedMonster):
+        return (AI_CONFUSED, ai.duration, capture_ai(ai.old_ai))
+    return (AI_BASIC,)
+
+def write_ai(out, ai):
+    out.pack('B', ai[0])
+    if ai[0] == AI_CONFUSED:
+        out.pack('H', ai[1])
+        write_ai(out, ai[2])
+
+def read_ai(reader):
+    kind, = reader.unpack('B')
+    if kind == AI_CONFUSED:
+        duration, = reader.unpack('H')
+        return entities.ConfusedMonster(read_ai(reader), duration)
+    elif kind == AI_BASIC:
+        return entities.BasicMonster()
+    return None
+
+def capture_entity(e, ids, on_map):
+    """ The fields of e that get saved, copied into a tuple: (kind, x, y,
+    char, flags, level, color, name, on_move, extra), where extra depends on
+    the kind (see write_entity).
+
+    """
+    if isinstance(e, entities.EntityItem):
+        kind = KIND_ITEM
+    elif isinstance(e, entities.EntityLiving):
+        kind = KIND_LIVING
+    else:
+        kind = KIND_ENTITY
+
+    flags = 0
+    if e.blocks:
+        flags |= ENTITY_BLOCKS
+    if e.always_visible:
+        flags |= ENTITY_ALWAYS_VISIBLE
+    if on_map:
+        flags |= ENTITY_ON_MAP
+
+    extra = None
+    if kind == KIND_ITEM:
+        extra = e.item.on_use if e.item is not None else None
+    elif kind == KIND_LIVING:
+        f = e.fighter
+        if f is not None:
+            f = (f.hp, f.max_hp, f.defense, f.power, f.xp, f.on_death, f.on_kill)
+        extra = (f, e.speed, capture_ai(e.ai), tuple(ids[item] for item in e.inventory))
+
+    return (kind, e.x, e.y, e.char, flags, e.level, (e.color.r, e.color.g, e.color.b),
+            e.name, tuple(e.on_move), extra)
+
+def write_entity(out, record):
+    kind, x, y, char, flags, level, color, name, on_move, extra = record
+    out.pack('BHHcBH', kind, x, y, char, flags, level)
+    out.color(color)
+    out.string(name)
+    out.pack('B', len(on_move))
+    for f in on_move:
+        out.callback(f)
+
+    if kind == KIND_ITEM:
+        out.callback(extra)
+    elif kind == KIND_LIVING:
+        fighter, speed, ai, inventory = extra
+        out.pack('B', fighter is not None)
+        if fighter is not None:
+            out.pack('iiiii', *fighter[:5])
+            out.callback(fighter[5])
+            out.callback(fighter[6])
+        out.pack('H', speed)
+        write_ai(out, ai)
+        out.pack('H', len(inventory))
+        for i in inventory:
+            out.pack('I', i)
+
+def read_entity(reader):
+    kind, x, y, char, flags, level = reader.unpack('BHHcBH')
+    color = reader.color()
+    name = reader.string()
+    on_move_count, = reader.unpack('B')
+    on_move = [reader.callback() for unused in range(on_move_count)]
+
+    inventory = []
+    if kind == KIND_ITEM:
+        e = entities.EntityItem(x, y, char, name, color, item=entities.Item(on_use=reader.callback()))
+    elif kind == KIND_LIVING:
+        fighter = None
+        has_fighter, = reader.unpack('B')
+        if has_fighter:
+            hp, max_hp, defense, power, xp = reader.unpack('iiiii')
+            fighter = entities.Fighter(max_hp, defense, power, xp,
+                                       on_death=reader.callback(), on_kill=reader.callback())
+            fighter.hp = hp
+        speed, = reader.unpack('H')
+        e = entities.EntityLiving(x, y, char, name, color, fighter=fighter, ai=read_ai(reader))
+        e.speed = speed
+        ai = e.ai
+        while isinstance(ai, entities.ConfusedMonster) and ai.old_ai is not None:
+            ai = ai.old_ai
+            ai.owner = e
+        inventory_count, = reader.unpack('H')
+        inventory = list(reader.unpack('%dI' % inventory_count))
+    else:
+        e = entities.Entity(x, y, char, name, color)
+
+    e.blocks = bool(flags & ENTITY_BLOCKS)
+    e.always_visible = bool(flags & ENTITY_ALWAYS_VISIBLE)
+    e.level = level
+    e.on_move = on_move
+    return e, bool(flags & ENTITY_ON_MAP), inventory
+
+def snapshot(map, messages, streams=None):
+    """ Capture what a save of a dungeon level, the message log and the
+    state of the game's random streams (by default, rng.streams.save())
+    holds, for pack_snapshot to turn into a save later, possibly on another
+    thread. This only copies the map's layers and each entity's fields,
+    leaving all the encoding to pack_snapshot.
+
+    """
+    if streams is None:
+        streams = rng.streams.save()
+
+    table = list(map.entities)
+    for e in map.entities:
+        table.extend(getattr(e, 'inventory', []))
+    ids = dict((e, i) for i, e in enumerate(table))
+
+    return {'width': map.width, 'height': map.height, 'streams': streams,
+            'level': map.level, 'fullbright': map.fullbright,
+            'player': ids.get(map.player, -1), 'stairs': ids.get(map.stairs, -1),
+            'upstairs': ids.get(map.upstairs, -1),
+            'rooms': [(r.x1, r.y1, r.x2, r.y2) for r in map.rooms],
+            'layers': [bytearray(layer) for layer in (map.pass_through, map.see_through, map.explored)],
+            'entities': [capture_entity(e, ids, i < len(map.entities)) for i, e in enumerate(table)],
+            'messages': [(line, (color.r, color.g, color.b)) for line, color in messages]}
+
+def pack_snapshot(snap):
+    """ Encode and compress a snapshot into a save """
+    out = Writer()
+    seed, draws = snap['streams']
+    out.pack('I', seed)
+    out.pack(STREAMS_FORMAT, *draws)
+    out.pack('HBiii', snap['level'], snap['fullbright'], snap['player'], snap['stairs'],
+             snap['upstairs'])
+    out.pack('H', len(snap['rooms']))
+    for room in snap['rooms']:
+        out.pack('hhhh', *room)
+
+    for layer in snap['layers']:
+        out.parts.append(pack_bits(layer))
+
+    out.pack('I', len(snap['entities']))
+    for record in snap['entities']:
+        write_entity(out, record)
+
+    out.pack('H', len(snap['messages']))
+    for line, color in snap['messages']:
+        out.string(line)
+        out.color(color)
+
+    return (HEADER.pack(MAGIC, VERSION, FLAG_COMPRESSED, snap['width'], snap['height']) +
+            zlib.compress(out.getvalue()))
+
+def dumps(map, messages, streams=None):
+    """ Serialize a dungeon level, the message log and the state of the
+    game's random streams to a string.
+
+    """
+    return pack_snapshot(snapshot(map, messages, streams))
+
+def loads(data, console):
+    """ Rebuild a dungeon level and message log from a string made by dumps;
+    the level will render to console. Returns (map, messages, streams), the
+    last being the state to pass to rng.restore.
+
+    """
+    magic, version, flags, width, height = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a save file, or one from another version')
+
+    body = data[HEADER.size:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    reader = Reader(body)
+
+    seed, = reader.unpack('I')
+    streams = (seed, reader.unpack(STREAMS_FORMAT))
+    level, fullbright, player_id, stairs_id, upstairs_id = reader.unpack('HBiii')
+    map = dungeon.Map(console, level=level, width=width, height=height)
+    map.fullbright = bool(fullbright)
+
+    room_count, = reader.unpack('H')
+    for unused in range(room_count):
+        room = dungeon.Room(map)
+        room.x1, room.y1, room.x2, room.y2 = reader.unpack('hhhh')
+        map.rooms.append(room)
+
+    cells = width * height
+    packed_size = (cells + 7) // 8
+    map.pass_through[:] = unpack_bits(reader.raw(packed_size), cells)
+    map.see_through[:] = unpack_bits(reader.raw(packed_size), cells)
+    map.explored[:] = unpack_bits(reader.raw(packed_size), cells)
+
+    entity_count, = reader.unpack('I')
+    table = []
+    for unused in range(entity_count):
+        table.append(read_entity(reader))
+
+    for e, on_map, inventory in table:
+        if on_map:
+            map.add_entity(e)
+        if inventory:
+            e.inventory = [table[i][0] for i in inventory]
+
+    if player_id >= 0:
+        map.player = table[player_id][0]
+    if stairs_id >= 0:
+        map.stairs = table[stairs_id][0]
+    if upstairs_id >= 0:
+        map.upstairs = table[upstairs_id][0]
+
+    message_count, = reader.unpack('H')
+    messages = []
+    for unused in range(message_count):
+        line = reader.string()
+        messages.append((line, reader.color()))
+
+    map.init_fov()
+    return map, messages, streams
+
+def write_file(path, data):
+    """ Replace the file at path with data, atomically where the OS allows """
+    # Named for this process, so that games saving side by side don't clash
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    try:
+        os.rename(temp, path)
+    except OSError:
+        # Windows won't rename over an existing file
+        os.remove(path)
+        os.rename(temp, path)
+
+def save(path, map, messages, streams=None):
+    write_file(path, dumps(map, messages, streams))
+
+def load(path, console):
+    with open(path, 'rb') as f:
+        return loads(f.read(), console)
+
+class Autosaver:
+    """ Saves the game every interval turns, and whenever asked to, without
+    holding up the game loop.
+
+    The level is snapshotted on the calling thread, which only copies its
+    layers and entities; a worker thread encodes, compresses and writes it. If saves to one file come
+    in faster than they can be written, only the newest is kept. A save that
+    fails is reported against its own path, by wait(path) or take_errors().
+
+    """
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.turns = 0
+        self.pending = {} # path -> snapshot waiting to be written
+        self.busy = False
+        self.failed = {} # path -> error of the last save to it, if it failed
+        self.thread = None
+        self.cond = threading.Condition()
+
+    def tick(self, map, messages):
+        """ Count a turn, saving when interval turns have passed """
+        self.turns += 1
+        if self.turns >= self.interval:
+            self.save(map, messages)
+
+    def save(self, map, messages, path=None):
+        """ Save map and messages to path, by default the autosave file """
+        if path is None:
+            path = self.path
+            self.turns = 0
+        snap = snapshot(map, messages)
+        with self.cond:
+            self.pending[path] = snap
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='autosave')
+                self.thread.daemon = True
+                self.thread.start()
+            self.cond.notify_all()
+
+    def wait(self, path=None):
+        """ Block until every requested save is on disk. With a path, return
+        the error the last save to it failed with, or None if it went fine.
+
+        """
+        with self.cond:
+            while self.pending or self.busy:
+                self.cond.wait()
+            if path is not None:
+                return self.failed.pop(path, None)
+
+    def take_errors(self):
+        """ The (path, error) of every save that failed since last asked """
+        with self.cond:
+            failed, self.failed = self.failed, {}
+        return failed.items()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                path, snap = self.pending.popitem()
+                self.busy = True
+
+            try:
+                write_file(path, pack_snapshot(snap))
+                error = None
+            except (IOError, OSError), e:
+                error = e
+
+            with self.cond:
+                self.busy = False
+                if error is not None:
+                    self.failed[path] = error
+                else:
+                    self.failed.pop(path, None)
+                self.cond.notify_all()
@@ -1,4 +1,6 @@
 from math import ceil
+import bisect
+import collections
 import textwrap
 
 import tcod
@@ -28,23 +30,107 @@ class Rect:
         return (self.x1 <= other.x2 and self.x2 >= other.x1 and
                 self.y1 <= other.y2 and self.y2 >= other.y1)
 
+class MessageLog:
+    """
+    The last depth messages, as (text, color), oldest first: once full, the
+    oldest drops off as each new one comes in. Messages are kept whole, and
+    only wrapped to a width when shown at it (see lines), each message once
+    per width.
+    """
+    def __init__(self, messages=(), depth=const.MSG_HISTORY):
+        self.messages = collections.deque(messages, depth)
+        self.wrapped = {} # (text, width) -> lines
+        self.revision = 0 # bumped on every change
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __repr__(self):
+        return repr(list(self.messages))
+
+    def add(self, text, color=tcod.COLOR_WHITE):
+        self.messages.append((text, color))
+        self.revision += 1
+
+    def clear(self):
+        self.messages.clear()
+        self.revision += 1
+
+    def wrap(self, text, width):
+        key = (text, width)
+        lines = self.wrapped.get(key)
+        if lines is None:
+            if len(self.wrapped) >= 2 * self.messages.maxlen:
+                self.wrapped.clear() # mostly texts long gone from the log
+            lines = self.wrapped[key] = textwrap.wrap(text, width)
+        return lines
+
+    def lines(self, width, count=None):
+        """ The last count lines of the log (all of them if None), wrapped
+        to width, as (line, color), oldest first. Only as many messages as it
+        takes are wrapped.
+
+        """
+        lines = []
+        for text, color in reversed(self.messages):
+            for line in reversed(self.wrap(text, width)):
+                lines.append((line, color))
+            if count is not None and len(lines) >= count:
+                del lines[count:]
+                break
+        lines.reverse()
+        return lines
+
 class GUIPanel:
-    def __init__(self, x, y, width, height):
+    """
+    The panel under the map: bars, labels, the message log and a status line.
+    Each of these widgets is only redrawn onto the panel's console when what
+    it shows has changed (see changed); the console keeps the rest from frame
+    to frame, and is blitted whole.
+    """
+    def __init__(self, x, y, width, height, background=const.PANEL_BACKGROUND):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
+        self.background = background
         self.console = tcod.Console(width, height)
-        self.messages = []
+        self.messages = MessageLog()
         self.status_message = ('', tcod.COLOR_BLACK)
+        self.shown = {} # widget -> what it was last drawn showing
 
-    def clear(self, color):
-        self.console.set_default_background(color)
+    def clear(self, color=None):
+        """ Blank the whole panel, so that every widget gets redrawn """
+        if color is not None:
+            self.background = color
+        self.console.set_default_background(self.background)
         self.console.clear()
+        self.shown.clear()
+
+    def clear_rect(self, x, y, width, height):
+        self.console.set_default_background(self.background)
+        self.console.rect(x, y, width, height, clear=True, effect=tcod.BACKGROUND_SET)
+
+    def changed(self, widget, *shown):
+        """ Whether widget needs drawing to show shown (the values it is drawn
+        from), which it does unless that is what it shows already. Callers
+        that get True are expected to draw it.
+
+        """
+        if not self.shown:
+            self.clear() # first time round
+        if self.shown.get(widget) == shown:
+            return False
+        self.shown[widget] = shown
+        return True
 
     def render_bar(self, x, y, width, label, value, maximum, bar_color, back_color, text_color=tcod.COLOR_WHITE):
         bar_width = int(ceil(float(value * width) / maximum))
 
+        self.clear_rect(x, y, width, 1) # as the bar is blended onto what's there
         self.console.set_default_background(back_color)
         self.console.rect(x, y, width, height=1, clear=True, effect=tcod.BACKGROUND_SCREEN)
 
@@ -57,27 +143,25 @@ class GUIPanel:
                               "%s: %d/%d" % (label, value, maximum))
 
     def add_message(self, text, color=tcod.COLOR_WHITE):
-        lines = textwrap.wrap(text, const.MSG_WIDTH)
-
-        for line in lines:
-            if len(self.messages) >= const.MSG_HEIGHT:
-                del self.messages[0]
-
-            self.messages.append((line, color))
+        self.messages.add(text, color)
 
     def status(self, text, color=tcod.COLOR_WHITE):
         self.status_message = (text, color)
 
     def render(self, dest_console, x=None, y=None):
-        message_y = 1
-        for line, color in self.messages:
+        if self.changed('messages', self.messages, self.messages.revision):
+            self.clear_rect(const.PANEL_MSG_X, 1, self.width - const.PANEL_MSG_X, self.height - 1)
+            message_y = 1
+            for line, color in self.messages.lines(const.MSG_WIDTH, const.MSG_HEIGHT):
+                self.console.set_default_foreground(color)
+                self.console.print_ex(const.PANEL_MSG_X, message_y, text=line)
+                message_y += 1
+
+        if self.changed('status', *self.status_message):
+            self.clear_rect(0, 0, self.width, 1)
+            line, color = self.status_message
             self.console.set_default_foreground(color)
-            self.console.print_ex(const.PANEL_MSG_X, message_y, text=line)
-            message_y += 1
-
-        line, color = self.status_message
-        self.console.set_default_foreground(color)
-        self.console.print_ex(1, 0, tcod.BACKGROUND_NONE, tcod.ALIGN_LEFT, line)
+            self.console.print_ex(1, 0, tcod.BACKGROUND_NONE, tcod.ALIGN_LEFT, line)
 
         if x is None:
             x = self.x
@@ -97,32 +181,76 @@ def label_generator(char):
 def xp_to_level_up(level=1):
     return const.LEVEL_UP_BASE + (level * const.LEVEL_UP_INCREMENT)
 
-def menu(header, options, width):
-    if len(options) > 26:
-        raise ValueError('Cannot have a menu with more than 26 options!')
+class ConsolePool:
+    """
+    Off-screen consoles, kept by size to be used again rather than made and
+    freed every time one is needed for a moment.
+    """
+    def __init__(self):
+        self.free = {} # (width, height) -> consoles
+
+    def take(self, width, height):
+        """ A blank console of the given size """
+        free = self.free.get((width, height))
+        if not free:
+            return tcod.Console(width, height)
+        con = free.pop()
+        con.set_default_background(tcod.COLOR_BLACK)
+        con.clear()
+        return con
+
+    def give(self, con):
+        """ Return a console got from take, once done with it """
+        self.free.setdefault((con.width, con.height), []).append(con)
+
+consoles = ConsolePool()
 
-    header_height = 0
-    if len(header) > 0:
-        header_height = tcod.root_console.get_height_rect(width=width, text=header)
-    height = header_height + len(options)
+# Menus drawn by render_menu, least recently shown first:
+# (header, options, width) -> console
+menu_cache = collections.OrderedDict()
 
-    con = tcod.Console(width, height)
-    con.set_default_foreground(tcod.COLOR_WHITE)
-    con.print_rect_ex(text=header)
+def render_menu(header, options, width):
+    """ A console with the menu drawn on it, drawn afresh only if it isn't
+    one of the last MENU_CACHE_SIZE shown.
 
-    y = header_height
-    letter_index = ord('a')
-    for option_text in options:
-        text = '( ) ' + option_text
+    """
+    key = (header, tuple(options), width)
+    con = menu_cache.pop(key, None)
+    if con is None:
+        header_height = 0
+        if len(header) > 0:
+            header_height = tcod.root_console.get_height_rect(width=width, text=header)
+        height = header_height + len(options)
+
+        con = consoles.take(width, height)
         con.set_default_foreground(tcod.COLOR_WHITE)
-        con.print_ex(y=y, text=text)
-        con.set_default_foreground(tcod.COLOR_YELLOW)
-        con.put_char(1, y, chr(letter_index))
-        y += 1
-        letter_index += 1
+        con.print_rect_ex(text=header)
+
+        y = header_height
+        letter_index = ord('a')
+        for option_text in options:
+            text = '( ) ' + option_text
+            con.set_default_foreground(tcod.COLOR_WHITE)
+            con.print_ex(y=y, text=text)
+            con.set_default_foreground(tcod.COLOR_YELLOW)
+            con.put_char(1, y, chr(letter_index))
+            y += 1
+            letter_index += 1
+
+        while len(menu_cache) >= const.MENU_CACHE_SIZE:
+            unused, old = menu_cache.popitem(last=False)
+            consoles.give(old)
+
+    menu_cache[key] = con
+    return con
+
+def menu(header, options, width):
+    if len(options) > 26:
+        raise ValueError('Cannot have a menu with more than 26 options!')
 
+    con = render_menu(header, options, width)
     x = const.SCREEN_WIDTH/2 - width/2
-    y = const.SCREEN_HEIGHT/2 - height/2
+    y = const.SCREEN_HEIGHT/2 - con.height/2
     con.blit(dest_x=x, dest_y=y, alpha_bg=0.7)
 
     tcod.flush()
@@ -147,25 +275,73 @@ def msgbox(text, width=50):
 def msgbox_ml(lines, width=50):
     msgbox('\n'.join(lines), width)
 
+def message_history(log=None, width=const.SCREEN_WIDTH, height=const.SCREEN_HEIGHT):
+    """ Page back through the message log, by default the panel's: up and
+    down scroll a line, page up and down a page, home and end go to the
+    oldest and newest messages, and any other key closes it.
+
+    """
+    if log is None:
+        log = panel.messages
+
+    lines = log.lines(width - 2)
+    page = height - 2
+    last = max(0, len(lines) - page) # top line of the newest page
+    top = last
+
+    con = consoles.take(width, height)
+    while not tcod.is_window_closed():
+        con.set_default_background(const.PANEL_BACKGROUND)
+        con.clear()
+        con.set_default_foreground(tcod.COLOR_YELLOW)
+        con.print_ex(x=1, y=0, text='Messages (%d-%d of %d lines; arrows, Page Up/Down, Home/End to scroll)' % (
+                     min(top + 1, len(lines)), min(top + page, len(lines)), len(lines)))
+        y = 1
+        for line, color in lines[top:top + page]:
+            con.set_default_foreground(color)
+            con.print_ex(x=1, y=y, text=line)
+            y += 1
+        con.blit()
+        tcod.flush()
+
+        key, mouse = tcod.wait_for_event(tcod.EVENT_KEY_PRESS, flush=True)
+        if key.vk == tcod.KEY_UP or key.vk == tcod.KEY_KP8:
+            top -= 1
+        elif key.vk == tcod.KEY_DOWN or key.vk == tcod.KEY_KP2:
+            top += 1
+        elif key.vk == tcod.KEY_PAGEUP or key.vk == tcod.KEY_KP9:
+            top -= page
+        elif key.vk == tcod.KEY_PAGEDOWN or key.vk == tcod.KEY_KP3:
+            top += page
+        elif key.vk == tcod.KEY_HOME or key.vk == tcod.KEY_KP7:
+            top = 0
+        elif key.vk == tcod.KEY_END or key.vk == tcod.KEY_KP1:
+            top = last
+        else:
+            break
+        top = max(0, min(top, last))
+    consoles.give(con)
+
 def render_all(player):
     player.map.render()
-    panel.clear(const.PANEL_BACKGROUND)
-    panel.render_bar(1, 1, const.BAR_WIDTH, label='HP',
-                     value=player.fighter.hp, maximum=player.fighter.max_hp,
-                     bar_color=const.PANEL_HPBAR_COLOR, back_color=const.PANEL_HPBAR_BACK,
-                     text_color=const.PANEL_TEXT_COLOR)
-    panel.render_bar(1, 2, const.BAR_WIDTH, label='XP',
-                     value=player.fighter.xp, maximum=xp_to_level_up(player.level),
-                     bar_color=const.PANEL_XPBAR_COLOR, back_color=const.PANEL_XPBAR_BACK,
-                     text_color=const.PANEL_TEXT_COLOR)
-
-    panel.console.set_default_foreground(tcod.COLOR_YELLOW)
-    panel.console.print_ex(x=1, y=6, text='Dungeon(%d)' % player.map.level)
+    if panel.changed('hp', player.fighter.hp, player.fighter.max_hp):
+        panel.render_bar(1, 1, const.BAR_WIDTH, label='HP',
+                         value=player.fighter.hp, maximum=player.fighter.max_hp,
+                         bar_color=const.PANEL_HPBAR_COLOR, back_color=const.PANEL_HPBAR_BACK,
+                         text_color=const.PANEL_TEXT_COLOR)
+    if panel.changed('xp', player.fighter.xp, xp_to_level_up(player.level)):
+        panel.render_bar(1, 2, const.BAR_WIDTH, label='XP',
+                         value=player.fighter.xp, maximum=xp_to_level_up(player.level),
+                         bar_color=const.PANEL_XPBAR_COLOR, back_color=const.PANEL_XPBAR_BACK,
+                         text_color=const.PANEL_TEXT_COLOR)
+    if panel.changed('level', player.map.level):
+        panel.clear_rect(0, 6, const.PANEL_MSG_X, 1)
+        panel.console.set_default_foreground(tcod.COLOR_YELLOW)
+        panel.console.print_ex(x=1, y=6, text='Dungeon(%d)' % player.map.level)
 
     player.map.console.blit()
     panel.render(tcod.root_console)
     tcod.flush()
-    player.map.post_render()
 
 def target_tile(player, max_range=None):
     while True:
@@ -173,11 +349,11 @@ def target_tile(player, max_range=None):
         key, mouse = tcod.check_for_event()
         render_all(player)
 
-        x, y = (mouse.cx, mouse.cy)
+        x, y = player.map.screen_to_map(mouse.cx, mouse.cy)
         if mouse.rbutton_pressed or key.vk == tcod.KEY_ESCAPE:
             panel.add_message('Cancelled.', tcod.COLOR_RED)
             return (None, None)
-        elif(mouse.lbutton_pressed and player.map.is_visible(x, y) and
+        elif(mouse.lbutton_pressed and x is not None and player.map.is_visible(x, y) and
              (max_range is None or player.distance(x, y) <= max_range)):
             return (x, y)
 
@@ -199,12 +375,12 @@ def character_sheet(player):
                'Strength (attack): %d' % player.fighter.power,
                'Agility (defense): %d' % player.fighter.defense], 40)
 
-def random_choice_index(options):
+def random_choice_index(options, rand=tcod.random):
     max_roll = sum(options)
     if(max_roll <= 0):
         raise ValueError('Trying to pick between %d options!' % max_roll)
 
-    die_roll = tcod.random.get_int(sum(options))
+    die_roll = rand.get_int(sum(options))
 
     for i in range(len(options)):
         if options[i] == 0:
@@ -215,7 +391,7 @@ def random_choice_index(options):
         else:
             die_roll -= options[i]
 
-def random_choice(options_dict):
+def random_choice(options_dict, rand=tcod.random):
     """
     An options_dict looks like this {option1: 10, option2: 15}, where the keys
     are the options, and the values are their chance of occurring.
@@ -224,7 +400,7 @@ def random_choice(options_dict):
     """
 
     options = options_dict.keys()
-    return options[random_choice_index(options_dict.values())]
+    return options[random_choice_index(options_dict.values(), rand)]
 
 def from_level(levels_dict, level=1):
     """
@@ -235,9 +411,42 @@ def from_level(levels_dict, level=1):
     levels 4 and above the returned value would be 12.
     """
 
-    for l in reversed(levels_dict.keys()):
-        if l <= level:
-            return levels_dict[l]
+    return LevelTable(levels_dict).get(level)
 
-    return 0
+class LevelTable:
+    """
+    A levels_dict (see from_level), sorted once so that looking up a level is
+    a bisection.
+    """
+    def __init__(self, levels_dict):
+        self.levels = tuple(sorted(levels_dict))
+        self.values = tuple(levels_dict[l] for l in self.levels)
 
+    def get(self, level=1):
+        i = bisect.bisect_right(self.levels, level)
+        if i == 0:
+            return 0
+        return self.values[i - 1]
+
+class ChoiceTable:
+    """
+    random_choice, compiled for a fixed set of options. It takes a list of
+    (option, chance) pairs, in an order that matters: it decides which option
+    each roll of the die picks, and so keeps seeded games reproducible.
+
+    The die is rolled just as random_choice_index rolls it, with one face per
+    unit of chance plus one more, for the first option. The table lists the
+    option for every face, so choosing is a single roll and a lookup.
+    """
+    def __init__(self, weighted):
+        total = sum(chance for option, chance in weighted)
+        if total <= 0:
+            raise ValueError('Trying to pick between %d options!' % total)
+
+        faces = []
+        for option, chance in weighted:
+            faces.extend([option] * chance)
+        self.faces = tuple(faces[:1] + faces)
+
+    def choose(self, rand=tcod.random):
+        return self.faces[rand.get_int(len(self.faces) - 1)]
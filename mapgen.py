@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Generate dungeon levels in bulk, without a window, and report on each one.
+
+    mapgen.py [--seeds FIRST:LAST] [--level N] [--size WxH] [--processes N] [--output FILE]
+
+Every seed in the range (LAST excluded) gets one level, generated and
+populated exactly as in a game started with that seed, spread over a pool of
+worker processes. One CSV row is written per level:
+
+    seed, level, rooms, floor coverage (fraction of the map), corridor cells
+    (floor outside any room), monsters, items, stairs distance (steps from
+    the player's spawn point to the stairs, -1 if unreachable) and
+    generation time in milliseconds
+
+followed by a summary of each column on stderr.
+"""
+import collections
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from optparse import OptionParser
+
+os.environ['TCOD_HEADLESS'] = '1'
+
+import tcod
+
+from game import const, levels, rng
+
+COLUMNS = ['seed', 'level', 'rooms', 'floor', 'corridor', 'monsters', 'items',
+           'stairs_distance', 'gen_ms']
+
+console = None
+
+def init_worker():
+    global console
+    console = tcod.Console(const.VIEW_WIDTH, const.VIEW_HEIGHT)
+
+def walk_distance(map, start, goal):
+    """ Number of steps (8-way) from start to goal over floor, or -1 """
+    width = map.width
+    start = start.y * width + start.x
+    goal = goal.y * width + goal.x
+    steps = {start: 0}
+    queue = collections.deque([start])
+    while queue:
+        i = queue.popleft()
+        if i == goal:
+            return steps[i]
+        x, y = i % width, i // width
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nx, ny = x + dx, y + dy
+                if nx < 0 or ny < 0 or nx >= width or ny >= map.height:
+                    continue
+                n = ny * width + nx
+                if n not in steps and map.pass_through[n]:
+                    steps[n] = steps[i] + 1
+                    queue.append(n)
+    return -1
+
+def measure(map):
+    in_room = bytearray(map.width * map.height)
+    for r in map.rooms:
+        row = b'\x01' * (r.x2 - r.x1 - 2)
+        for y in range(r.y1 + 1, r.y2 - 1):
+            start = y * map.width
+            in_room[start + r.x1 + 1:start + r.x2 - 1] = row
+
+    floor = map.pass_through.count(b'\x01')
+    corridor = sum(1 for p, r in zip(map.pass_through, in_room) if p and not r)
+    monsters = sum(1 for e in map.entities if e.ai is not None)
+    items = sum(1 for e in map.entities if getattr(e, 'item', None) is not None)
+
+    return {'rooms': len(map.rooms),
+            'floor': round(float(floor) / len(map.pass_through), 4),
+            'corridor': corridor,
+            'monsters': monsters,
+            'items': items,
+            'stairs_distance': walk_distance(map, map.rooms[0].center(), map.stairs)}
+
+def generate_one(args):
+    seed, level, width, height = args
+    streams = rng.Streams(seed).for_level(level)
+    start = time.time()
+    map = levels.generate(console, level, streams, width, height)
+    elapsed = time.time() - start
+
+    row = measure(map)
+    row.update(seed=seed, level=level, gen_ms=round(elapsed * 1000, 3))
+    return row
+
+def summarize(rows, out):
+    for column in COLUMNS[2:]:
+        values = sorted(row[column] for row in rows)
+        mean = float(sum(values)) / len(values)
+        out.write('%-16s min %-9s median %-9s mean %-10.3f max %s\n' % (
+            column, values[0], values[len(values) // 2], mean, values[-1]))
+
+def main(argv):
+    parser = OptionParser(usage='%prog [--seeds FIRST:LAST] [--level N] [--size WxH] [--processes N] [--output FILE]')
+    parser.add_option('--seeds', default='0:1000',
+                      help='range of seeds to generate levels for [default: %default]')
+    parser.add_option('--level', type='int', default=1,
+                      help='dungeon level to generate [default: %default]')
+    parser.add_option('--size', default='%dx%d' % (const.MAP_WIDTH, const.MAP_HEIGHT),
+                      help='size of the levels, in cells [default: %default]')
+    parser.add_option('--processes', type='int', default=None,
+                      help='worker processes [default: one per core]')
+    parser.add_option('--output', default=None,
+                      help='CSV file to write instead of stdout')
+    options, args = parser.parse_args(argv)
+
+    try:
+        first, last = [int(s) for s in options.seeds.split(':')]
+    except ValueError:
+        parser.error('--seeds expects FIRST:LAST, e.g. 0:1000')
+    try:
+        width, height = [int(s) for s in options.size.split('x')]
+    except ValueError:
+        parser.error('--size expects WxH, e.g. 200x100')
+    jobs = [(seed, options.level, width, height) for seed in range(first, last)]
+    if len(jobs) == 0:
+        parser.error('the seed range is empty')
+
+    if options.output is None:
+        out = sys.stdout
+    else:
+        out = open(options.output, 'wb')
+
+    writer = csv.DictWriter(out, COLUMNS)
+    writer.writerow(dict(zip(COLUMNS, COLUMNS)))
+
+    pool = multiprocessing.Pool(options.processes, init_worker)
+    start = time.time()
+    rows = []
+    for row in pool.imap(generate_one, jobs, chunksize=16):
+        writer.writerow(row)
+        rows.append(row)
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+
+    if out is not sys.stdout:
+        out.close()
+
+    sys.stderr.write('%d levels in %.2fs (%.0f levels/s)\n' % (len(rows), elapsed, len(rows) / elapsed))
+    summarize(rows, sys.stderr)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
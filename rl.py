@@ -1,10 +1,8 @@
 #!/usr/bin/env python
-import shelve
-
 import tcod
-from tcod import libtcodpy as libtcod
+from tcod import libtcod
 
-from game import const, dungeon, entities, utils
+from game import const, entities, levels, rng, savefile, utils
 panel = utils.panel
 
 def handle_events(player):
@@ -18,9 +16,11 @@ def handle_events(player):
         player.blocks = not player.blocks
         panel.add_message("Noclip set to " + str(not player.blocks), tcod.COLOR_LIGHT_FLAME)
     elif key.c == ord('X'):
-        player.map.fullbright = not player.map.fullbright
+        player.map.set_fullbright(not player.map.fullbright)
     elif key.c == ord('D'):
         print panel.messages
+    elif key.c == ord('m'):
+        utils.message_history(panel.messages)
 
     if player.fighter.hp > 0:
         if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
@@ -65,10 +65,16 @@ def handle_events(player):
         elif key.c == ord('<') or key.c == ord('>'):
             if player.map.stairs.x == player.x and player.map.stairs.y == player.y:
                 return const.ACTION_DESCEND_STAIRS
+            upstairs = player.map.upstairs
+            if upstairs is not None and upstairs.x == player.x and upstairs.y == player.y:
+                return const.ACTION_ASCEND_STAIRS
         elif key.c == ord('c'):
             utils.character_sheet(player)
 
-    ents = player.map.entities_at(mouse.cx, mouse.cy, only_visible=True)
+    x, y = player.map.screen_to_map(mouse.cx, mouse.cy)
+    ents = []
+    if x is not None:
+        ents = player.map.entities_at(x, y, only_visible=True)
     if len(ents) > 0:
         names = ', '.join([e.name for e in ents])
         panel.status(names.capitalize(), tcod.COLOR_LIGHT_GRAY)
@@ -79,7 +85,7 @@ def handle_events(player):
 
 def level_up_screen(player):
     choice = None
-    while choice is None:
+    while choice is None and not tcod.is_window_closed():
         choice = utils.menu('Level up! Choose a stat to raise:\n',
                       ['Constitution (+20 HP, from ' + str(player.fighter.max_hp) + ')',
                        'Strength (+1 attack, from ' + str(player.fighter.power) + ')',
@@ -96,8 +102,8 @@ def level_up_screen(player):
             choice = None # Try again
 
 def recalc_fov(player, x, y):
-    player.map.fov_map.compute_fov(player.x, player.y, const.FOV_RADIUS,
-                            const.FOV_LIGHT_WALLS, const.FOV_ALGORITHM)
+    player.map.compute_fov(player.x, player.y, const.FOV_RADIUS,
+                           const.FOV_LIGHT_WALLS, const.FOV_ALGORITHM)
 
 def player_attack(player, x, y):
     ents = player.map.entities_at(x, y)
@@ -117,7 +123,7 @@ def player_death(player, killer):
     player.char = '%'
     player.color = const.COLOR_REMAINS
     player.name = 'remains of ' + player.name
-    player.map.fullbright = True
+    player.map.set_fullbright(True)
 
 def player_kill(fighter, killed):
     player = fighter.owner
@@ -133,11 +139,10 @@ def player_kill(fighter, killed):
                           tcod.COLOR_YELLOW)
         level_up_screen(player)
 
-def new_game():
-    map = dungeon.Map(console)
-    map.generate()
+def new_game(seed=None):
+    rng.seed(seed)
+    map = levels.generate(console, 1)
     #map.label_rooms()
-    map.populate_rooms()
 
     spawn = map.rooms[0].center()
     player = entities.EntityLiving(spawn.x, spawn.y, '@', 'the adventurer', tcod.COLOR_WHITE,
@@ -152,20 +157,24 @@ def new_game():
     player.on_move.append(player_attack)
     player.on_move.append(player_look)
 
-    panel.messages = []
+    level_store.clear()
+    pregenerate_below(map)
+    panel.messages.clear()
     panel.add_message("Have fun, and enjoy your death!", tcod.COLOR_RED)
     return player
 
-def next_level(player):
-    panel.add_message("You take a moment to rest and recover your strength.", tcod.COLOR_LIGHT_VIOLET)
-    player.fighter.heal(player.fighter.max_hp/2)
+def pregenerate_below(map):
+    if not level_store.has(map.level + 1):
+        pregenerator.start(map.level + 1)
 
-    panel.add_message('After a rare moment of peace, you descend further into the depths of the dungeon.', tcod.COLOR_RED)
-    new_map = dungeon.Map(player.map.console, level=player.map.level+1)
-    new_map.generate()
-    new_map.populate_rooms()
+def leave_level(player):
+    old_map = player.map
+    old_map.remove_entity(player)
+    old_map.player = None
+    level_store.put(old_map)
+    return old_map.level
 
-    spawn = new_map.rooms[0].center()
+def enter_level(player, new_map, spawn):
     player.x = spawn.x
     player.y = spawn.y
 
@@ -173,21 +182,57 @@ def next_level(player):
     new_map.player = player
 
     recalc_fov(player, 0, 0)
+    autosaver.save(new_map, panel.messages)
+    pregenerate_below(new_map)
+
+def next_level(player):
+    level = leave_level(player) + 1
+    new_map = level_store.get(level)
+    if new_map is not None:
+        panel.add_message('You descend once more to level %d of the dungeon.' % level, tcod.COLOR_RED)
+        enter_level(player, new_map, new_map.upstairs)
+        return
+
+    panel.add_message("You take a moment to rest and recover your strength.", tcod.COLOR_LIGHT_VIOLET)
+    player.fighter.heal(player.fighter.max_hp/2)
+
+    panel.add_message('After a rare moment of peace, you descend further into the depths of the dungeon.', tcod.COLOR_RED)
+    new_map = pregenerator.take(level)
+    enter_level(player, new_map, new_map.rooms[0].center())
+
+def previous_level(player):
+    level = leave_level(player) - 1
+    new_map = level_store.get(level)
+    if new_map is None: # lost, e.g. to a crash before it was written out
+        new_map = levels.generate(console, level)
+    panel.add_message('You climb back up to level %d of the dungeon.' % level, tcod.COLOR_RED)
+    enter_level(player, new_map, new_map.stairs)
+
+savefile.register_callbacks(recalc_fov, player_attack, player_look, player_death, player_kill)
+autosaver = savefile.Autosaver(const.SAVE_FILE, const.AUTOSAVE_INTERVAL)
+
+def set_save_paths(save_file, levels_dir):
+    """ Save the game to save_file, and the levels left behind to levels_dir """
+    autosaver.wait()
+    autosaver.path = save_file
+    level_store.set_path(levels_dir)
 
 def save_game(map):
-    s = shelve.open('savegame', 'n')
-    s['map'] = map
-    s['panel_messages'] = panel.messages
-    s.close()
+    """ Save the game, returning the error it failed with, if any """
+    autosaver.save(map, panel.messages)
+    return autosaver.wait(autosaver.path)
 
-def load_game():
-    s = shelve.open('savegame', 'r')
-    map = s['map']
-    panel.messages = s['panel_messages']
-    s.close()
+def report_save_errors():
+    """ Tell the player about the background saves that failed """
+    for path, error in autosaver.take_errors():
+        panel.add_message('Saving to %s failed: %s' % (path, error), tcod.COLOR_RED)
 
-    map.init_fov()
+def load_game():
+    map, messages, streams = savefile.load(autosaver.path, console)
+    panel.messages = utils.MessageLog(messages)
+    rng.restore(streams)
     recalc_fov(map.player, 0, 0)
+    pregenerate_below(map)
     return map.player
 
 def game_loop(player):
@@ -196,14 +241,20 @@ def game_loop(player):
 
         action = handle_events(player)
         if action == const.ACTION_EXIT:
-            save_game(player.map)
+            error = save_game(player.map)
+            if error is not None:
+                utils.msgbox('Saving the game failed: %s' % error)
             break
         elif action == const.ACTION_DESCEND_STAIRS:
             next_level(player)
+        elif action == const.ACTION_ASCEND_STAIRS:
+            previous_level(player)
         elif action != const.ACTION_NONE:
-            for e in player.map.entities:
-                if e.ai is not None:
-                    e.ai.think()
+            player.map.pass_time(player.action_time())
+            autosaver.tick(player.map, panel.messages)
+
+        if autosaver.failed:
+            report_save_errors()
 
 def main_menu():
     img = tcod.ImageFile("menu_background1.png")
@@ -233,9 +284,11 @@ def main_menu():
 
 tcod.set_custom_font('fonts/consolas12x12_gs_tc.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
 tcod.init_root(const.SCREEN_WIDTH, const.SCREEN_HEIGHT, 'Random Life', False)
-console = tcod.Console(const.MAP_WIDTH, const.MAP_HEIGHT)
+console = tcod.Console(const.VIEW_WIDTH, const.VIEW_HEIGHT)
+level_store = levels.LevelStore(console, const.LEVELS_DIR, autosaver, const.LEVEL_CACHE_SIZE)
+pregenerator = levels.Pregenerator(console)
 
-libtcod.sys_set_fps(const.LIMIT_FPS)
+tcod.set_fps(const.LIMIT_FPS)
 
 if __name__ == '__main__':
     main_menu()
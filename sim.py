@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Run Random Life without a window, feeding the game loop scripted input.
+
+    sim.py [--turns N] [--seed S] [--script FILE]
+
+With --script, FILE holds one key per line: either a single printable
+character (e.g. '.', 'g', '>') or the name of a tcod KEY_* constant without
+its prefix (e.g. KP8, UP). Otherwise, N random keys are generated from seed S.
+The game itself is started with seed S too, so a given seed and script always
+play out the same way. The game ends when the script runs out.
+
+The game is saved to a temporary directory, removed afterwards, unless
+--save-dir names one to keep the save in; a real game's save is never touched.
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+os.environ['TCOD_HEADLESS'] = '1'
+
+import tcod
+from tcod import headless
+
+import rl
+from game import const
+
+RANDOM_KEYS = [tcod.KEY_KP1, tcod.KEY_KP2, tcod.KEY_KP3, tcod.KEY_KP4, tcod.KEY_KP6,
+               tcod.KEY_KP7, tcod.KEY_KP8, tcod.KEY_KP9, '.', 'g', '>', 'a', 'b']
+
+def random_script(turns, seed):
+    rand = random.Random(seed)
+    for unused in range(turns):
+        yield rand.choice(RANDOM_KEYS)
+
+def file_script(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            elif len(line) == 1:
+                yield line
+            else:
+                yield getattr(tcod, 'KEY_' + line.upper())
+
+def main(argv):
+    parser = OptionParser(usage='%prog [--turns N] [--seed S] [--script FILE] [--save-dir DIR]')
+    parser.add_option('--turns', type='int', default=10000,
+                      help='number of random keys to feed the game [default: %default]')
+    parser.add_option('--seed', type='int', default=None,
+                      help='seed for the game and the random key script')
+    parser.add_option('--script', default=None,
+                      help='file of keys to feed the game instead of random ones')
+    parser.add_option('--save-dir', default=None,
+                      help='directory to save the game in [default: a temporary one]')
+    options, args = parser.parse_args(argv)
+
+    if options.script is not None:
+        headless.set_script(file_script(options.script))
+    else:
+        headless.set_script(random_script(options.turns, options.seed))
+
+    save_dir = options.save_dir
+    if save_dir is None:
+        save_dir = tempfile.mkdtemp(prefix='randomlife-')
+    elif not os.path.isdir(save_dir):
+        os.makedirs(save_dir)
+    rl.set_save_paths(os.path.join(save_dir, const.SAVE_FILE),
+                      os.path.join(save_dir, const.LEVELS_DIR))
+
+    try:
+        player = rl.new_game(options.seed)
+        start = time.time()
+        rl.game_loop(player)
+        elapsed = time.time() - start
+    finally:
+        if options.save_dir is None:
+            rl.autosaver.wait()
+            shutil.rmtree(save_dir, ignore_errors=True)
+
+    print 'Finished on dungeon level %d; player level %d, HP %d/%d, XP %d.' % (
+        player.map.level, player.level, player.fighter.hp, player.fighter.max_hp, player.fighter.xp)
+    if options.script is None:
+        print '%d keys in %.2fs (%.0f keys/s).' % (options.turns, elapsed, options.turns / elapsed)
+    else:
+        print 'Script finished in %.2fs.' % elapsed
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
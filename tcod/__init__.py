@@ -1,10 +1,50 @@
 import libtcodpy as libtcod
+if libtcod.HEADLESS:
+    import headless as libtcod
+import cmwc
+import fov
 
 Color = libtcod.Color
+ConsoleBuffer = libtcod.ConsoleBuffer
+
+RANDOM_ENGINE_LIBTCOD = 'libtcod'
+RANDOM_ENGINE_PYTHON = 'python'
 
 class Random:
-    def __init__(self, stream_id):
+    def __init__(self, stream_id=None, seed=None, algo=libtcod.RNG_CMWC, engine=RANDOM_ENGINE_LIBTCOD):
+        """ Random(stream_id) wraps an existing generator (0 being libtcod's
+        default one); otherwise a new generator is made, seeded with seed, or
+        from the clock if seed is None.
+
+        With engine=RANDOM_ENGINE_PYTHON, the generator is tcod/cmwc.py's port
+        of libtcod's CMWC rather than libtcod's own, which gives the same
+        numbers for the same seed.
+
+        """
+        self.engine = engine
+        if engine == RANDOM_ENGINE_PYTHON:
+            self.lib = cmwc
+        else:
+            self.lib = libtcod
+
+        self.owned = stream_id is None
+        if stream_id is None:
+            if seed is None:
+                stream_id = self.lib.random_new(algo)
+            else:
+                stream_id = self.lib.random_new_from_seed(seed, algo)
         self.stream_id = stream_id
+        self.seed = seed
+        # How many numbers were taken from the generator, which (with seed)
+        # pins down its state; see skip
+        self.draws = 0
+
+    def __del__(self):
+        if self.owned:
+            try:
+                self.lib.random_delete(self.stream_id)
+            except (AttributeError, TypeError):
+                pass # libtcod is already gone, at interpreter exit
 
     def get_int(self, *args, **kwargs):
         """ rand.get_int([start,] stop) -> random integer
@@ -33,7 +73,40 @@ class Random:
         if 'stop' in kwargs:
             max_value = kwargs['stop']
 
-        return libtcod.random_get_int(self.stream_id, min_value, max_value)
+        if min_value != max_value:
+            self.draws += 1
+        return self.lib.random_get_int(self.stream_id, min_value, max_value)
+
+    def get_float(self, start, stop):
+        """ Random float in [start, stop] """
+        if cmwc.f32(start) != cmwc.f32(stop):
+            self.draws += 1
+        return self.lib.random_get_float(self.stream_id, start, stop)
+
+    def skip(self, count):
+        """ Move on by count numbers, as if they had been drawn. A generator
+        made from the same seed and moved on by another's draws continues
+        exactly where the other one is.
+
+        """
+        for unused in xrange(count):
+            self.lib.random_get_int(self.stream_id, 0, 1)
+        self.draws += count
+
+    def save(self):
+        """ Snapshot the generator's state, as a new Random which continues
+        from this point; restore() rewinds self to such a snapshot.
+
+        """
+        backup = Random(self.lib.random_save(self.stream_id), engine=self.engine)
+        backup.owned = True
+        backup.seed = self.seed
+        backup.draws = self.draws
+        return backup
+
+    def restore(self, backup):
+        self.lib.random_restore(self.stream_id, backup.stream_id)
+        self.draws = backup.draws
 
 # A default Random for anyone to use
 random = Random(0)
@@ -71,6 +144,9 @@ def is_window_closed():
 def flush():
     return libtcod.console_flush()
 
+def set_fps(fps):
+    return libtcod.sys_set_fps(fps)
+
 class Console:
     # Root console has id 0
     ROOT_ID = 0
@@ -136,6 +212,34 @@ class Console:
     def clear(self):
         return libtcod.console_clear(self.console_id)
 
+    def fill(self, back=None, fore=None, chars=None):
+        """ Paint the whole console at once from row-major arrays.
+
+        back and fore are (r, g, b) triples of sequences holding one value per
+        cell, indexed [y * width + x]; chars holds one character code per cell.
+        Any of them may be left out to keep that layer as it is.
+
+        """
+        if back is not None:
+            libtcod.console_fill_background(self.console_id, *back)
+        if fore is not None:
+            libtcod.console_fill_foreground(self.console_id, *fore)
+        if chars is not None:
+            libtcod.console_fill_char(self.console_id, chars)
+
+    def draw_buffer(self, buffer, fill_fore=True, fill_back=True):
+        """ Paint a ConsoleBuffer of the same size onto this console """
+        if buffer.width != self.width or buffer.height != self.height:
+            raise ValueError('Console.draw_buffer: the buffer is not the size of the console.')
+
+        back = fore = chars = None
+        if fill_back:
+            back = (buffer.back_r, buffer.back_g, buffer.back_b)
+        if fill_fore:
+            fore = (buffer.fore_r, buffer.fore_g, buffer.fore_b)
+            chars = buffer.char
+        self.fill(back=back, fore=fore, chars=chars)
+
     def get_height_rect(self, x=0, y=0, width=None, height=None, text=''):
         if width is None:
             width = self.width
@@ -156,26 +260,97 @@ class Console:
 # The root console
 root_console = Console(console_id=Console.ROOT_ID)
 
+# Engines a Map can compute its field of view with
+FOV_ENGINE_LIBTCOD = 'libtcod'
+FOV_ENGINE_PYTHON = 'python'
+
 class Map:
-    def __init__(self, width, height):
+    def __init__(self, width, height, engine=FOV_ENGINE_LIBTCOD):
         self.width = width
         self.height = height
-        self.map = libtcod.map_new(width, height)
+        self.engine = engine
+        if engine == FOV_ENGINE_PYTHON:
+            self.lib = fov
+        else:
+            self.lib = libtcod
+        self.map = self.lib.map_new(width, height)
+        # Bumped whenever a cell's properties change
+        self.revision = 0
+        # What the current field of view was computed from
+        self.fov_key = None
 
     def __getstate__(self):
-        return {'width': self.width, 'height': self.height}
+        return {'width': self.width, 'height': self.height, 'engine': self.engine}
 
     def __setstate__(self, state):
-        self.__init__(state['width'], state['height'])
+        self.__init__(state['width'], state['height'], state.get('engine', FOV_ENGINE_LIBTCOD))
 
     def set_properties(self, x, y, see_through, pass_through):
-        return libtcod.map_set_properties(self.map, x, y, see_through, pass_through)
+        self.revision += 1
+        return self.lib.map_set_properties(self.map, x, y, see_through, pass_through)
+
+    def set_all_properties(self, see_through, pass_through):
+        """ Set the properties of every cell from two row-major sequences of
+        width * height truth values, indexed [y * width + x].
+
+        """
+        if len(see_through) != self.width * self.height or len(pass_through) != len(see_through):
+            raise ValueError('set_all_properties expects one value per cell')
+
+        self.revision += 1
+        if hasattr(self.lib, 'map_set_all_properties'):
+            return self.lib.map_set_all_properties(self.map, see_through, pass_through)
+
+        # libtcod has no bulk setter, so clear the map to opaque walls in one
+        # call and only set the cells that differ from that.
+        self.lib.map_clear(self.map, False, False)
+        for i in range(self.width * self.height):
+            if see_through[i] or pass_through[i]:
+                self.lib.map_set_properties(self.map, i % self.width, i // self.width,
+                                            see_through[i], pass_through[i])
 
     def compute_fov(self, x, y, radius, light_walls, algorithm):
-        return libtcod.map_compute_fov(self.map, x, y, radius, light_walls, algorithm)
+        """ Compute the field of view from (x, y), unless it was last computed
+        with the same parameters and the map has not changed since. Returns
+        whether it was recomputed.
+
+        """
+        key = (x, y, radius, light_walls, algorithm, self.revision)
+        if key == self.fov_key:
+            return False
+
+        self.fov_key = key
+        self.lib.map_compute_fov(self.map, x, y, radius, light_walls, algorithm)
+        return True
 
     def is_in_fov(self, x, y):
-        return libtcod.map_is_in_fov(self.map, x, y)
+        return self.lib.map_is_in_fov(self.map, x, y)
+
+    def get_fov(self):
+        """ Return the current field of view as a bytearray of 0/1 values,
+        indexed [y * width + x]. Treat it as read-only.
+
+        """
+        if hasattr(self.lib, 'map_get_fov'):
+            return self.lib.map_get_fov(self.map)
+
+        fov = bytearray(self.width * self.height)
+        if self.fov_key is None:
+            return fov
+
+        # only cells within the light radius can be lit, so only ask about those
+        x, y, radius = self.fov_key[:3]
+        if radius > 0:
+            x1, y1 = max(x - radius, 0), max(y - radius, 0)
+            x2, y2 = min(x + radius + 1, self.width), min(y + radius + 1, self.height)
+        else:
+            x1, y1, x2, y2 = 0, 0, self.width, self.height
+
+        for cy in range(y1, y2):
+            for cx in range(x1, x2):
+                if self.lib.map_is_in_fov(self.map, cx, cy):
+                    fov[cy * self.width + cx] = 1
+        return fov
 
 class Image:
     def __init__(self, width, height):
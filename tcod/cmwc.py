@@ -0,0 +1,126 @@
+"""
+libtcod's random number generator in pure Python.
+
+This is a port of the complementary-multiply-with-carry (CMWC4096) generator
+from libtcod 1.5.1's mersenne.c, including its seeding, so a generator made
+here from a given seed produces the same numbers as libtcod's. The functions
+mirror libtcodpy's random_* functions: tcod.Random can use this module in
+place of libtcod (see RANDOM_ENGINE_PYTHON), and the headless backend uses it
+outright. As in libtcod, generator 0 stands for the default generator, which
+is seeded from the clock.
+
+Only RNG_CMWC and the linear distribution are supported.
+"""
+import copy
+import struct
+import time
+from array import array
+
+from libtcodpy import RNG_CMWC
+
+# 1 / 0xffffffff, the scale libtcod applies to turn a number into a fraction
+RAND_DIV = 1.0 / 0xffffffff
+
+def f32(value):
+    """ Round value to single precision, as a C float would """
+    return struct.unpack('f', struct.pack('f', value))[0]
+
+RAND_DIV_FLOAT = f32(RAND_DIV)
+
+class CMWC:
+    def __init__(self, seed):
+        s = seed & 0xffffffff
+        q = array('I', [0]) * 4096
+        for i in range(4096):
+            s = (s * 1103515245 + 12345) & 0xffffffff # glibc's LCG
+            q[i] = s
+        self.q = q
+        self.c = ((s * 1103515245 + 12345) & 0xffffffff) % 809430660
+        self.cur = 0
+
+    def next(self):
+        """ The next raw 32-bit number """
+        cur = self.cur = (self.cur + 1) & 4095
+        t = 18782 * self.q[cur] + self.c
+        c = t >> 32
+        x = (t + c) & 0xffffffff
+        if x < c:
+            x += 1
+            c += 1
+        if x == 0xffffffff:
+            c += 1
+            x = 0
+        self.c = c
+        number = self.q[cur] = 0xfffffffe - x
+        return number
+
+    def get_int(self, mi, ma):
+        if mi == ma:
+            return mi
+        elif ma < mi:
+            mi, ma = ma, mi
+        return int(self.next() % (ma - mi + 1) + mi)
+
+    def get_float(self, mi, ma):
+        mi, ma = f32(mi), f32(ma)
+        if mi == ma:
+            return mi
+        elif ma < mi:
+            mi, ma = ma, mi
+        delta = f32(ma - mi)
+        return f32(mi + f32(f32(f32(self.next()) * RAND_DIV_FLOAT) * delta))
+
+    def get_double(self, mi, ma):
+        if mi == ma:
+            return mi
+        elif ma < mi:
+            mi, ma = ma, mi
+        return mi + self.next() * RAND_DIV * (ma - mi)
+
+    def copy(self):
+        other = copy.copy(self)
+        other.q = array('I', self.q)
+        return other
+
+    def restore(self, other):
+        self.q = array('I', other.q)
+        self.c = other.c
+        self.cur = other.cur
+
+_instance = []
+
+def _get(rnd):
+    if not rnd:
+        return random_get_instance()
+    return rnd
+
+def random_get_instance():
+    if not _instance:
+        _instance.append(CMWC(int(time.time())))
+    return _instance[0]
+
+def random_new(algo=RNG_CMWC):
+    return random_new_from_seed(int(time.time()), algo)
+
+def random_new_from_seed(seed, algo=RNG_CMWC):
+    if algo != RNG_CMWC:
+        raise ValueError('Only RNG_CMWC is available in pure Python')
+    return CMWC(seed)
+
+def random_get_int(rnd, mi, ma):
+    return _get(rnd).get_int(mi, ma)
+
+def random_get_float(rnd, mi, ma):
+    return _get(rnd).get_float(mi, ma)
+
+def random_get_double(rnd, mi, ma):
+    return _get(rnd).get_double(mi, ma)
+
+def random_save(rnd):
+    return _get(rnd).copy()
+
+def random_restore(rnd, backup):
+    _get(rnd).restore(backup)
+
+def random_delete(rnd):
+    pass
@@ -0,0 +1,250 @@
+"""
+Field of view in pure Python, as an alternative to libtcod's map module.
+
+The functions here mirror libtcodpy's map_* functions, so tcod.Map can use
+this module in place of libtcod (see FOV_ENGINE_PYTHON), and the headless
+backend uses it outright. Cell properties and the computed field of view are
+kept as bytearrays of 0/1, indexed [y * width + x]; a map's fov attribute is
+the result of the last compute_fov.
+
+FOV_BASIC is a port of libtcod's circular raycasting, down to its line
+algorithm and the post-processing that lights walls next to lit floor, so it
+lights the same cells; every other algorithm is served by recursive
+shadowcasting, ported from libtcod's FOV_SHADOW.
+"""
+import math
+
+from libtcodpy import FOV_BASIC, FOV_RESTRICTIVE
+
+class FovMap:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.transparent = bytearray(width * height)
+        self.walkable = bytearray(width * height)
+        self.fov = bytearray(width * height)
+
+    def cast_ray(self, xo, yo, xd, yd, r2, light_walls):
+        # Walk libtcod's line (TCOD_line_init/TCOD_line_step) from (xo, yo)
+        # to (xd, yd), lighting cells until past the light radius, off the
+        # map, or one cell beyond the first wall (lit only with light_walls).
+        width, n = self.width, len(self.fov)
+        transparent, fov = self.transparent, self.fov
+        deltax = xd - xo
+        deltay = yd - yo
+        stepx = cmp(deltax, 0)
+        stepy = cmp(deltay, 0)
+        x_major = stepx * deltax > stepy * deltay
+        if x_major:
+            e = stepx * deltax
+        else:
+            e = stepy * deltay
+        deltax *= 2
+        deltay *= 2
+
+        curx, cury = xo, yo
+        inside = blocked = end = False
+        i = cury * width + curx
+        if 0 <= i < n:
+            inside = True
+            fov[i] = 1
+        while not end:
+            if x_major:
+                if curx == xd:
+                    end = True # and the last cell is looked at once more
+                else:
+                    curx += stepx
+                    e -= stepy * deltay
+                    if e < 0:
+                        cury += stepy
+                        e += stepx * deltax
+            else:
+                if cury == yd:
+                    end = True
+                else:
+                    cury += stepy
+                    e -= stepx * deltax
+                    if e < 0:
+                        curx += stepx
+                        e += stepy * deltay
+
+            if r2 > 0 and (curx - xo) * (curx - xo) + (cury - yo) * (cury - yo) > r2:
+                return
+            i = cury * width + curx
+            if 0 <= i < n:
+                inside = True
+                if not blocked and not transparent[i]:
+                    blocked = True
+                elif blocked:
+                    return # past the wall
+                if light_walls or not blocked:
+                    fov[i] = 1
+            elif inside:
+                return # off the map
+
+    def postprocess(self, x0, y0, x1, y1, dx, dy):
+        # Light the walls next to lit floor in the (dx, dy) direction, within
+        # the quadrant (x0, y0)-(x1, y1), which rays tend to miss
+        width, n = self.width, len(self.fov)
+        transparent, fov = self.transparent, self.fov
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                i = cy * width + cx
+                if not (0 <= i < n and fov[i] and transparent[i]):
+                    continue
+                x2 = cx + dx
+                y2 = cy + dy
+                if x0 <= x2 <= x1:
+                    j = cy * width + x2
+                    if 0 <= j < n and not transparent[j]:
+                        fov[j] = 1
+                if y0 <= y2 <= y1:
+                    j = y2 * width + cx
+                    if 0 <= j < n and not transparent[j]:
+                        fov[j] = 1
+                if x0 <= x2 <= x1 and y0 <= y2 <= y1:
+                    j = y2 * width + x2
+                    if 0 <= j < n and not transparent[j]:
+                        fov[j] = 1
+
+    def compute_basic(self, x, y, radius, light_walls):
+        # libtcod's circular raycasting: a ray to every cell on the edge of
+        # the lit box, then the post-processing pass for walls
+        xmin, ymin, xmax, ymax = 0, 0, self.width, self.height
+        if radius > 0:
+            xmin = max(0, x - radius)
+            ymin = max(0, y - radius)
+            xmax = min(self.width, x + radius + 1)
+            ymax = min(self.height, y + radius + 1)
+        r2 = radius * radius
+
+        for xo in range(xmin, xmax):
+            self.cast_ray(x, y, xo, ymin, r2, light_walls)
+        for yo in range(ymin + 1, ymax):
+            self.cast_ray(x, y, xmax - 1, yo, r2, light_walls)
+        # As in libtcod, the bottom and left edges run on to the map's edge
+        # rather than stopping at xmin and ymin
+        for xo in range(xmax - 2, -1, -1):
+            self.cast_ray(x, y, xo, ymax - 1, r2, light_walls)
+        for yo in range(ymax - 2, 0, -1):
+            self.cast_ray(x, y, xmin, yo, r2, light_walls)
+
+        if light_walls:
+            self.postprocess(xmin, ymin, x, y, -1, -1)
+            self.postprocess(x, ymin, xmax - 1, y, 1, -1)
+            self.postprocess(xmin, y, x, ymax - 1, -1, 1)
+            self.postprocess(x, y, xmax - 1, ymax - 1, 1, 1)
+
+    # Transforms from octant-local (dx, dy) to map coordinates
+    OCTANTS = [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+               (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]
+
+    def cast_light(self, cx, cy, row, start, end, radius, r2, xx, xy, yx, yy, light_walls):
+        if start < end:
+            return
+
+        width, height = self.width, self.height
+        transparent, fov = self.transparent, self.fov
+        new_start = 0.0
+        for j in range(row, radius + 1):
+            dx = -j - 1
+            dy = -j
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                x = cx + dx * xx + dy * xy
+                y = cy + dx * yx + dy * yy
+                if x < 0 or y < 0 or x >= width or y >= height:
+                    continue
+
+                i = y * width + x
+                l_slope = (dx - 0.5) / (dy + 0.5)
+                r_slope = (dx + 0.5) / (dy - 0.5)
+                if start < r_slope:
+                    continue
+                elif end > l_slope:
+                    break
+
+                if dx * dx + dy * dy <= r2 and (light_walls or transparent[i]):
+                    fov[i] = True
+
+                if blocked:
+                    if not transparent[i]:
+                        new_start = r_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif not transparent[i] and j < radius:
+                    blocked = True
+                    self.cast_light(cx, cy, j + 1, start, l_slope, radius, r2,
+                                    xx, xy, yx, yy, light_walls)
+                    new_start = r_slope
+            if blocked:
+                break
+
+    def compute_shadow(self, x, y, radius, light_walls):
+        if radius == 0:
+            radius_x = max(self.width - x, x)
+            radius_y = max(self.height - y, y)
+            radius = int(math.sqrt(radius_x * radius_x + radius_y * radius_y)) + 1
+        r2 = radius * radius
+
+        for xx, xy, yx, yy in self.OCTANTS:
+            self.cast_light(x, y, 1, 1.0, 0.0, radius, r2, xx, xy, yx, yy, light_walls)
+
+    def compute_fov(self, x, y, radius, light_walls, algorithm):
+        self.fov = bytearray(self.width * self.height)
+        if algorithm == FOV_BASIC:
+            self.compute_basic(x, y, radius, light_walls)
+        else:
+            self.compute_shadow(x, y, radius, light_walls)
+        self.fov[y * self.width + x] = True
+
+def map_new(w, h):
+    return FovMap(w, h)
+
+def map_set_properties(m, x, y, isTrans, isWalk):
+    i = y * m.width + x
+    m.transparent[i] = bool(isTrans)
+    m.walkable[i] = bool(isWalk)
+
+def map_clear(m, walkable=False, transparent=False):
+    n = m.width * m.height
+    m.transparent = bytearray([bool(transparent)]) * n
+    m.walkable = bytearray([bool(walkable)]) * n
+
+def map_copy(source, dest):
+    dest.width, dest.height = source.width, source.height
+    dest.transparent = bytearray(source.transparent)
+    dest.walkable = bytearray(source.walkable)
+    dest.fov = bytearray(source.fov)
+
+def map_set_all_properties(m, transparent, walkable):
+    m.transparent = bytearray(map(bool, transparent))
+    m.walkable = bytearray(map(bool, walkable))
+
+def map_compute_fov(m, x, y, radius=0, light_walls=True, algo=FOV_RESTRICTIVE):
+    m.compute_fov(x, y, radius, light_walls, algo)
+
+def map_is_in_fov(m, x, y):
+    return m.fov[y * m.width + x] != 0
+
+def map_get_fov(m):
+    # compute_fov replaces m.fov rather than writing into it, so handing out
+    # the array itself is safe
+    return m.fov
+
+def map_is_transparent(m, x, y):
+    return m.transparent[y * m.width + x] != 0
+
+def map_is_walkable(m, x, y):
+    return m.walkable[y * m.width + x] != 0
+
+def map_delete(m):
+    pass
+
+def map_get_width(m):
+    return m.width
+
+def map_get_height(m):
+    return m.height
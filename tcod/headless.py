@@ -0,0 +1,156 @@
+"""
+Null rendering and input backend, used in place of libtcodpy when the
+TCOD_HEADLESS environment variable is set.
+
+Drawing calls do nothing, consoles only remember their size, and input comes
+from a script queued with set_script() rather than from a window. Once the
+script runs out, the "window" is considered closed, so game loops that check
+is_window_closed() wind down on their own.
+
+Random numbers come from tcod/cmwc.py and field of view from tcod/fov.py,
+both pure Python ports, so the game logic behaves as it would with the native
+library.
+"""
+import textwrap
+
+from libtcodpy import *
+
+############################
+# scripted input
+############################
+_script = iter([])
+_closed = False
+
+def set_script(events):
+    """ Queue input for the game to consume, replacing any previous script.
+
+    events may be any iterable (including an endless generator). Each event is
+    either a one-character string (a printable key press, as in key.c), a
+    KEY_* virtual key code, or a (cx, cy) tuple moving the mouse to that cell.
+
+    """
+    global _script, _closed
+    _script = iter(events)
+    _closed = False
+
+def _next_event(k, m):
+    global _closed
+    k.vk = KEY_NONE
+    k.c = 0
+    k.pressed = False
+    m.lbutton_pressed = m.rbutton_pressed = m.mbutton_pressed = False
+
+    if _closed:
+        return 0
+
+    try:
+        event = next(_script)
+    except StopIteration:
+        _closed = True
+        return 0
+
+    if isinstance(event, tuple):
+        m.cx, m.cy = event
+        return EVENT_MOUSE_MOVE
+
+    if isinstance(event, str):
+        k.vk = KEY_CHAR
+        k.c = ord(event)
+    else:
+        k.vk = event
+    k.pressed = True
+    return EVENT_KEY_PRESS
+
+def sys_check_for_event(mask, k, m):
+    return _next_event(k, m)
+
+def sys_wait_for_event(mask, k, m, flush):
+    return _next_event(k, m)
+
+def console_wait_for_keypress(flush):
+    k = Key()
+    _next_event(k, Mouse())
+    return k
+
+def console_check_for_keypress(flags=KEY_RELEASED):
+    return console_wait_for_keypress(False)
+
+def console_is_window_closed():
+    return _closed
+
+def console_is_key_pressed(key):
+    return False
+
+def console_is_fullscreen():
+    return False
+
+############################
+# consoles
+############################
+_console_sizes = {}
+_next_console_id = [1]
+
+def console_init_root(w, h, title, fullscreen=False, renderer=RENDERER_SDL):
+    _console_sizes[0] = (w, h)
+
+def console_new(w, h):
+    console_id = _next_console_id[0]
+    _next_console_id[0] += 1
+    _console_sizes[console_id] = (w, h)
+    return console_id
+
+def console_delete(con):
+    _console_sizes.pop(con, None)
+
+def console_get_width(con):
+    return _console_sizes.get(con, (0, 0))[0]
+
+def console_get_height(con):
+    return _console_sizes.get(con, (0, 0))[1]
+
+def console_get_height_rect(con, x, y, w, h, fmt):
+    lines = 0
+    for paragraph in fmt.split('\n'):
+        lines += max(1, len(textwrap.wrap(paragraph, w)))
+
+    if h > 0:
+        return min(lines, h)
+    return lines
+
+def console_print_rect_ex(con, x, y, w, h, flag, alignment, fmt):
+    return console_get_height_rect(con, x, y, w, h, fmt)
+
+def console_fill_background(con, r, g, b):
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+
+def console_fill_foreground(con, r, g, b):
+    if len(r) != len(g) or len(r) != len(b):
+        raise TypeError('R, G and B must all have the same size.')
+
+def console_fill_char(con, arr):
+    pass
+
+############################
+# images
+############################
+def image_load(filename):
+    return 0
+
+def image_get_size(image):
+    return 0, 0
+
+############################
+# random
+############################
+from cmwc import (random_get_instance, random_new, random_new_from_seed, random_get_int,
+                  random_get_float, random_get_double, random_save, random_restore,
+                  random_delete)
+
+############################
+# field of view
+############################
+from fov import (map_new, map_set_properties, map_set_all_properties, map_clear,
+                 map_copy, map_compute_fov, map_is_in_fov, map_get_fov,
+                 map_is_transparent, map_is_walkable, map_delete, map_get_width,
+                 map_get_height)
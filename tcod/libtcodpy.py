@@ -25,9 +25,11 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import os
 import sys
 import ctypes
 import struct
+from array import array
 from ctypes import *
 
 if not hasattr(ctypes, "c_bool"):   # for Python < 2.6
@@ -39,11 +41,31 @@ try:  #import NumPy if available
 except ImportError:
     numpy_available = False
 
+class _NullFunction(object):
+    # accepts any arguments and does nothing; restype/argtypes may be set on it
+    # like on a real foreign function.
+    def __call__(self, *args):
+        return 0
+
+class _NullLibrary(object):
+    # stands in for the native library when running headless, so that the
+    # constants and structures below remain importable without libtcod.
+    def __getattr__(self, name):
+        func = _NullFunction()
+        setattr(self, name, func)
+        return func
+
+# Set TCOD_HEADLESS=1 in the environment to run without the native library
+# (and without a window); see tcod/headless.py.
+HEADLESS = os.environ.get('TCOD_HEADLESS', '') not in ('', '0')
+
 LINUX=False
 MAC=False
 MINGW=False
 MSVC=False
-if sys.platform.find('linux') != -1:
+if HEADLESS:
+    _lib = _NullLibrary()
+elif sys.platform.find('linux') != -1:
     _lib = ctypes.cdll['./libtcod.so']
     LINUX=True
 elif sys.platform.find('darwin') != -1:
@@ -395,13 +417,28 @@ class Key(Structure):
               ('shift', c_bool),
               ]
 
+def _c_int_array(seq):
+    # returns seq as something TCOD functions taking an int* will accept.
+    # NumPy arrays and array('i') are passed without copying their data;
+    # anything else is converted into a fresh ctypes array.
+    if numpy_available and isinstance(seq, numpy.ndarray):
+        seq = numpy.ascontiguousarray(seq, dtype=numpy.intc)
+        pointer = seq.ctypes.data_as(POINTER(c_int))
+        pointer._array = seq # may be a copy: it must outlive the call
+        return pointer
+    if isinstance(seq, array) and seq.typecode == 'i':
+        return (c_int * len(seq)).from_buffer(seq)
+    return (c_int * len(seq))(*seq)
+
 class ConsoleBuffer:
     # simple console that allows direct (fast) access to cells. simplifies
-    # use of the "fill" functions.
+    # use of the "fill" functions. the seven layers are array('i') buffers,
+    # indexed [y * width + x], which blit hands to libtcod without copying.
+    LAYERS = ('back_r', 'back_g', 'back_b', 'fore_r', 'fore_g', 'fore_b', 'char')
+
     def __init__(self, width, height, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
         # initialize with given width and height. values to fill the buffer
         # are optional, defaults to black with no characters.
-        n = width * height
         self.width = width
         self.height = height
         self.clear(back_r, back_g, back_b, fore_r, fore_g, fore_b, char)
@@ -410,45 +447,56 @@ class ConsoleBuffer:
         # clears the console. values to fill it with are optional, defaults
         # to black with no characters.
         n = self.width * self.height
-        self.back_r = [back_r] * n
-        self.back_g = [back_g] * n
-        self.back_b = [back_b] * n
-        self.fore_r = [fore_r] * n
-        self.fore_g = [fore_g] * n
-        self.fore_b = [fore_b] * n
-        self.char = [ord(char)] * n
-    
+        self.back_r = array('i', [back_r]) * n
+        self.back_g = array('i', [back_g]) * n
+        self.back_b = array('i', [back_b]) * n
+        self.fore_r = array('i', [fore_r]) * n
+        self.fore_g = array('i', [fore_g]) * n
+        self.fore_b = array('i', [fore_b]) * n
+        self.char = array('i', [ord(char)]) * n
+        self.shared = False
+
     def copy(self):
-        # returns a copy of this ConsoleBuffer.
+        # returns a copy of this ConsoleBuffer. the copy shares its layers
+        # with this buffer until either of them is written to, at which
+        # point the writer takes a private copy (copy-on-write).
         other = ConsoleBuffer(0, 0)
         other.width = self.width
         other.height = self.height
-        other.back_r = list(self.back_r)  # make explicit copies of all lists
-        other.back_g = list(self.back_g)
-        other.back_b = list(self.back_b)
-        other.fore_r = list(self.fore_r)
-        other.fore_g = list(self.fore_g)
-        other.fore_b = list(self.fore_b)
-        other.char = list(self.char)
+        for layer in self.LAYERS:
+            setattr(other, layer, getattr(self, layer))
+        self.shared = other.shared = True
         return other
-    
+
+    def unshare(self):
+        # takes private copies of the layers if they are shared with a copy.
+        # called by every method that writes to the buffer; call it yourself
+        # before writing to the layers directly.
+        if self.shared:
+            for layer in self.LAYERS:
+                setattr(self, layer, array('i', getattr(self, layer)))
+            self.shared = False
+
     def set_fore(self, x, y, r, g, b, char):
         # set the character and foreground color of one cell.
+        self.unshare()
         i = self.width * y + x
         self.fore_r[i] = r
         self.fore_g[i] = g
         self.fore_b[i] = b
         self.char[i] = ord(char)
-    
+
     def set_back(self, x, y, r, g, b):
         # set the background color of one cell.
+        self.unshare()
         i = self.width * y + x
         self.back_r[i] = r
         self.back_g[i] = g
         self.back_b[i] = b
-    
+
     def set(self, x, y, back_r, back_g, back_b, fore_r, fore_g, fore_b, char):
         # set the background color, foreground color and character of one cell.
+        self.unshare()
         i = self.width * y + x
         self.back_r[i] = back_r
         self.back_g[i] = back_g
@@ -457,21 +505,73 @@ class ConsoleBuffer:
         self.fore_g[i] = fore_g
         self.fore_b[i] = fore_b
         self.char[i] = ord(char)
-    
+
+    def fill_rect(self, x, y, w, h, back=None, fore=None, char=None):
+        # fill a w*h region with a background (r, g, b), a foreground (r, g, b)
+        # and/or a character; whatever is left as None keeps its old value.
+        # the region is clipped to the buffer.
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, self.width), min(y + h, self.height)
+        if x2 <= x1 or y2 <= y1:
+            return
+
+        self.unshare()
+        values = []
+        if back is not None:
+            values += zip((self.back_r, self.back_g, self.back_b), back)
+        if fore is not None:
+            values += zip((self.fore_r, self.fore_g, self.fore_b), fore)
+        if char is not None:
+            values.append((self.char, ord(char)))
+
+        for layer, value in values:
+            row = array('i', [value]) * (x2 - x1)
+            for row_y in range(y1, y2):
+                start = row_y * self.width
+                layer[start + x1:start + x2] = row
+
+    def __getitem__(self, key):
+        # buffer[x1:x2, y1:y2] returns a new ConsoleBuffer holding that region.
+        # buffer[x, y] returns the cell as a tuple (back_r, back_g, back_b,
+        # fore_r, fore_g, fore_b, char).
+        kx, ky = key
+        if not isinstance(kx, slice) and not isinstance(ky, slice):
+            if not (0 <= kx < self.width and 0 <= ky < self.height):
+                raise IndexError('ConsoleBuffer index out of range')
+            i = self.width * ky + kx
+            return tuple(getattr(self, layer)[i] for layer in self.LAYERS[:-1]) + (chr(self.char[i]),)
+
+        if not isinstance(kx, slice):
+            kx = slice(kx, kx + 1)
+        if not isinstance(ky, slice):
+            ky = slice(ky, ky + 1)
+        x1, x2, x_step = kx.indices(self.width)
+        y1, y2, y_step = ky.indices(self.height)
+        if x_step != 1 or y_step != 1:
+            raise ValueError('ConsoleBuffer slices cannot have a step')
+
+        other = ConsoleBuffer(max(x2 - x1, 0), max(y2 - y1, 0))
+        for layer in self.LAYERS:
+            source = getattr(self, layer)
+            region = array('i')
+            for row_y in range(y1, y2):
+                start = row_y * self.width
+                region.extend(source[start + x1:start + x2])
+            setattr(other, layer, region)
+        return other
+
     def blit(self, dest, fill_fore=True, fill_back=True):
         # use libtcod's "fill" functions to write the buffer to a console.
         if (console_get_width(dest) != self.width or
             console_get_height(dest) != self.height):
             raise ValueError('ConsoleBuffer.blit: Destination console has an incorrect size.')
 
-        s = struct.Struct('%di' % len(self.back_r))
-
         if fill_back:
-            _lib.TCOD_console_fill_background(dest, (c_int * len(self.back_r))(*self.back_r), (c_int * len(self.back_g))(*self.back_g), (c_int * len(self.back_b))(*self.back_b))
+            _lib.TCOD_console_fill_background(dest, _c_int_array(self.back_r), _c_int_array(self.back_g), _c_int_array(self.back_b))
 
         if fill_fore:
-            _lib.TCOD_console_fill_foreground(dest, (c_int * len(self.fore_r))(*self.fore_r), (c_int * len(self.fore_g))(*self.fore_g), (c_int * len(self.fore_b))(*self.fore_b))
-            _lib.TCOD_console_fill_char(dest, (c_int * len(self.char))(*self.char))
+            _lib.TCOD_console_fill_foreground(dest, _c_int_array(self.fore_r), _c_int_array(self.fore_g), _c_int_array(self.fore_b))
+            _lib.TCOD_console_fill_char(dest, _c_int_array(self.char))
 
 _lib.TCOD_console_credits_render.restype = c_bool
 _lib.TCOD_console_is_fullscreen.restype = c_bool
@@ -911,55 +1011,17 @@ def console_fill_foreground(con,r,g,b) :
     if len(r) != len(g) or len(r) != len(b):
         raise TypeError('R, G and B must all have the same size.')
 
-    if (numpy_available and isinstance(r, numpy.ndarray) and
-        isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
-        #numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
-        cr = r.ctypes.data_as(POINTER(c_int))
-        cg = g.ctypes.data_as(POINTER(c_int))
-        cb = b.ctypes.data_as(POINTER(c_int))
-    else:
-        # otherwise convert using ctypes arrays
-        cr = (c_int * len(r))(*r)
-        cg = (c_int * len(g))(*g)
-        cb = (c_int * len(b))(*b)
-
-    _lib.TCOD_console_fill_foreground(con, cr, cg, cb)
+    _lib.TCOD_console_fill_foreground(con, _c_int_array(r), _c_int_array(g), _c_int_array(b))
 
 def console_fill_background(con,r,g,b) :
     if len(r) != len(g) or len(r) != len(b):
         raise TypeError('R, G and B must all have the same size.')
 
-    if (numpy_available and isinstance(r, numpy.ndarray) and
-        isinstance(g, numpy.ndarray) and isinstance(b, numpy.ndarray)):
-        #numpy arrays, use numpy's ctypes functions
-        r = numpy.ascontiguousarray(r, dtype=numpy.int_)
-        g = numpy.ascontiguousarray(g, dtype=numpy.int_)
-        b = numpy.ascontiguousarray(b, dtype=numpy.int_)
-        cr = r.ctypes.data_as(POINTER(c_int))
-        cg = g.ctypes.data_as(POINTER(c_int))
-        cb = b.ctypes.data_as(POINTER(c_int))
-    else:
-        # otherwise convert using ctypes arrays
-        cr = (c_int * len(r))(*r)
-        cg = (c_int * len(g))(*g)
-        cb = (c_int * len(b))(*b)
-
-    _lib.TCOD_console_fill_background(con, cr, cg, cb)
+    _lib.TCOD_console_fill_background(con, _c_int_array(r), _c_int_array(g), _c_int_array(b))
 
 def console_fill_char(con,arr) :
-    if (numpy_available and isinstance(arr, numpy.ndarray) ):
-        #numpy arrays, use numpy's ctypes functions
-        arr = numpy.ascontiguousarray(arr, dtype=numpy.int_)
-        carr = arr.ctypes.data_as(POINTER(c_int))
-    else:
-        #otherwise convert using the struct module
-        carr = struct.pack('%di' % len(arr), *arr)
+    _lib.TCOD_console_fill_char(con, _c_int_array(arr))
 
-    _lib.TCOD_console_fill_char(con, carr)
-        
 def console_load_asc(con, filename) :
     _lib.TCOD_console_load_asc(con,filename)
 def console_save_asc(con, filename) :